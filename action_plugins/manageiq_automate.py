@@ -26,9 +26,15 @@
 
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
+import os
+import time
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.plugins.action import ActionBase
 from ansible.utils.vars import merge_hash
 
+MANAGEIQ_MODULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    'library', 'manageiq_automate.py')
+
 MANAGEIQ_MODULE_VARS = ('username',
                         'password',
                         'url',
@@ -39,8 +45,60 @@ MANAGEIQ_MODULE_VARS = ('username',
                         'manageiq_validate_certs',
                         'force_basic_auth',
                         'client_cert',
-                        'client_key')
-
+                        'client_key',
+                        'keep_alive',
+                        'vmdb_cache',
+                        'vmdb_cache_path',
+                        'vmdb_cache_ttl',
+                        'vmdb_cache_size',
+                        'retries',
+                        'retry_backoff',
+                        'retry_max_backoff',
+                        'retry_posts',
+                        'circuit_breaker_threshold',
+                        'circuit_breaker_timeout',
+                        'max_response_size',
+                        'rate_limit',
+                        'rate_burst',
+                        'max_concurrency',
+                        'cache_token',
+                        'token_cache_path',
+                        'state_path')
+
+
+_manageiq_module = None
+
+
+def load_manageiq_module():
+    """
+        Load the manageiq_automate module shipped with the role to run it on the controller
+    """
+    global _manageiq_module
+    if _manageiq_module is None:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location('manageiq_automate_library', MANAGEIQ_MODULE_PATH)
+        _manageiq_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_manageiq_module)
+    return _manageiq_module
+
+
+class LocalModuleFailure(Exception):
+    pass
+
+
+class LocalModule(object):
+    """
+        Stand in for AnsibleModule when the Workspace runs in the action plugin
+    """
+
+    def __init__(self, params):
+        connection = dict(params['manageiq_connection'])
+        connection['url'] = connection['url'] or ''
+        self.params = dict(params, manageiq_connection=connection)
+
+
+    def fail_json(self, **kwargs):
+        raise LocalModuleFailure(kwargs)
 
 
 class ActionModule(ActionBase):
@@ -68,14 +126,101 @@ class ActionModule(ActionBase):
         return module_vars
 
 
+    def local_operation(self, module_vars, manageiq):
+        """
+            The operation to run on the controller, or None when the module has to be executed
+        """
+        if 'input' not in (module_vars.get('workspace') or dict()).get('workspace', dict()):
+            return None
+        operations = manageiq.requested_operations(module_vars)
+        if len(operations) != 1:
+            return None
+        key = operations[0]
+        if key == 'operations':
+            for operation in module_vars['operations']:
+                names = [name for name in operation.keys() if name != 'name']
+                if len(names) != 1 or not manageiq.local_operation(names[0]):
+                    return None
+            return key
+        if manageiq.local_operation(key):
+            return key
+        return None
+
+
+    def run_local(self, module_vars):
+        """
+            Answer read-only operations from the passed in workspace without shipping the module
+
+            Returns None when the operation needs the REST API, or the arguments do not pass the
+            module's argument spec so the module reports the error
+        """
+        try:
+            from ansible.module_utils.common.arg_spec import ArgumentSpecValidator
+            from ansible.module_utils.common.parameters import remove_values
+        except ImportError:
+            return None
+        manageiq = load_manageiq_module()
+        validated = ArgumentSpecValidator(manageiq.module_argument_spec()).validate(module_vars)
+        if validated.error_messages:
+            return None
+        params = validated.validated_parameters
+        key = self.local_operation(params, manageiq)
+        if key is None:
+            return None
+
+        started = time.time()
+        module = LocalModule(params)
+        workspace = manageiq.Workspace(module, params['workspace'])
+        try:
+            result = workspace.dispatch(key, params[key])
+        except LocalModuleFailure as failure:
+            result = dict(failed=True, **failure.args[0])
+        if params['profile']:
+            profile = manageiq.Profile()
+            profile.phase('operation', started)
+            result['profile'] = dict(profile.result(), local=True)
+        # Mask no_log values the way AnsibleModule.exit_json does
+        return remove_values(result, validated._no_log_values)
+
+
+    def execute_module(self, module_vars, task_vars):
+        """
+            Execute the module having it return only the workspace changes, and rebuild the workspace here
+
+            The module returns the full workspace instead when the one it was passed does not hash
+            to the one held here
+        """
+        base = (module_vars.get('workspace') or dict()).get('workspace')
+        if not isinstance(base, dict) or not boolean(module_vars.get('workspace_delta', True), strict=False):
+            return self._execute_module(module_args=module_vars, task_vars=task_vars)
+
+        manageiq = load_manageiq_module()
+        base_hash = manageiq.workspace_hash(base)
+        module_vars = dict(module_vars, workspace_delta=True, workspace_base_hash=base_hash)
+        result = self._execute_module(module_args=module_vars, task_vars=task_vars)
+        delta = result.pop('workspace_delta', None)
+        if delta is None:
+            return result
+        if delta['base'] != base_hash:
+            result.setdefault('warnings', []).append('The workspace changes do not apply to the passed in workspace, '
+                                                     'set workspace_delta to false to get the full workspace')
+            return result
+        result['workspace'] = manageiq.apply_workspace_diff(base, delta['changes'])
+        return result
+
+
     def run(self, tmp=None, task_vars=None):
         results = super(ActionModule, self).run(tmp, task_vars or dict())
 
         module_vars = self.manageiq_extra_vars(self._task.args.copy(), task_vars)
 
+        local_results = self.run_local(module_vars)
+        if local_results is not None:
+            return merge_hash(results, local_results)
+
         results = merge_hash(
             results,
-            self._execute_module(module_args=module_vars, task_vars=task_vars),
+            self.execute_module(module_vars, task_vars),
         )
 
         return results
@@ -0,0 +1,104 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    callback: manageiq_automate_profile
+    type: aggregate
+    short_description: Summarize the manageiq_automate profile results of a play
+    description:
+      - Adds up the C(profile) results of manageiq_automate tasks run with C(profile: true)
+        and prints the timings and HTTP counters per task at the end of the play.
+    requirements:
+      - enable in configuration
+'''
+
+from ansible.plugins.callback import CallbackBase
+
+
+class CallbackModule(CallbackBase):
+    """
+        Summarize the manageiq_automate profile results per task
+    """
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'manageiq_automate_profile'
+    CALLBACK_NEEDS_WHITELIST = True
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+        self._tasks = dict()
+
+
+    def _add(self, task_name, profile):
+        summary = self._tasks.setdefault(task_name, dict(calls=0, requests=0, bytes_sent=0,
+                                                         bytes_received=0, http_time=0.0,
+                                                         phases=dict(), status_codes=dict()))
+        summary['calls'] += 1
+        http = profile.get('http', dict())
+        for key in ('requests', 'bytes_sent', 'bytes_received'):
+            summary[key] += http.get(key, 0)
+        summary['http_time'] += http.get('time', 0.0)
+        for status, count in http.get('status_codes', dict()).items():
+            summary['status_codes'][status] = summary['status_codes'].get(status, 0) + count
+        for phase, elapsed in profile.get('phases', dict()).items():
+            summary['phases'][phase] = summary['phases'].get(phase, 0.0) + elapsed
+
+
+    def v2_runner_on_ok(self, result):
+        self._add_result(result)
+
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        # Failed tasks report their profile too, the timings of timeouts and retries matter most
+        self._add_result(result)
+
+
+    def _add_result(self, result):
+        # Loops return the item results in a list, operations return a dict of values
+        results = result._result.get('results')
+        if not isinstance(results, list):
+            results = [result._result]
+        for item in results:
+            if isinstance(item, dict) and isinstance(item.get('profile'), dict):
+                self._add(result._task.get_name(), item['profile'])
+
+
+    def v2_playbook_on_stats(self, stats):
+        if not self._tasks:
+            return
+        self._display.banner('MANAGEIQ AUTOMATE PROFILE')
+        for task_name, summary in self._tasks.items():
+            phases = ', '.join('%s %.3fs' % (phase, elapsed) for phase, elapsed in sorted(summary['phases'].items()))
+            status_codes = ', '.join('%s x%d' % (status, count) for status, count in sorted(summary['status_codes'].items()))
+            self._display.display('%s: %d calls, %d requests, %d bytes sent, %d bytes received, http %.3fs' %
+                                  (task_name, summary['calls'], summary['requests'], summary['bytes_sent'],
+                                   summary['bytes_received'], summary['http_time']))
+            self._display.display('    phases: %s' % phases)
+            if status_codes:
+                self._display.display('    status codes: %s' % status_codes)
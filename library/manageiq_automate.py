@@ -19,7 +19,9 @@
 
 
 from __future__ import (absolute_import, division, print_function)
-import os, functools
+import os, functools, time
+
+IMPORT_STARTED = time.time()
 
 __metaclass__ = type
 
@@ -32,10 +34,813 @@ DEFAULT_RETRY_INTERVAL = 60
 DOCUMENTATION = '''
 module: manageiq_automate
 '''
+import copy
+import hashlib
 import json
 import operator
+import threading
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.urls import fetch_url
+from ansible.module_utils.six.moves.urllib.parse import urlencode, urlparse
+
+# The HTTP, TLS, proxy and thread pool machinery is imported where it is used,
+# so tasks answered from the workspace they were given never load it.
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_WORKERS = 8
+DEFAULT_STATE_PATH = '~/.ansible/manageiq_automate'
+DEFAULT_VMDB_CACHE_PATH = '~/.ansible/manageiq_automate/vmdb_cache'
+DEFAULT_CHECKPOINT_PATH = '~/.ansible/manageiq_automate/checkpoints'
+DEFAULT_TOKEN_CACHE_PATH = '~/.ansible/manageiq_automate/tokens'
+DEFAULT_TOKEN_TTL = 600
+TOKEN_EXPIRY_MARGIN = 30
+DEFAULT_VMDB_CACHE_TTL = 300
+DEFAULT_VMDB_CACHE_SIZE = 256
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 1.0
+DEFAULT_RETRY_MAX_BACKOFF = 30.0
+DEFAULT_CIRCUIT_BREAKER_THRESHOLD = 5
+DEFAULT_CIRCUIT_BREAKER_TIMEOUT = 60
+RETRY_STATUS_CODES = (-1, 429, 502, 503, 504)
+# Requests that are safe to send again after a timeout, as the appliance may have run them already
+IDEMPOTENT_METHODS = ('get', 'head', 'put', 'delete', 'options')
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_MAX_PAGES = 10
+
+# The operations of the module by parameter name, filled in by the operation decorator
+OPERATIONS = dict()
+
+
+def operation(spec, read_only=False, network=False, batch=True, name=None):
+    """
+        Register a Workspace method as an operation of the module
+
+        spec is the argument spec of its parameter, bool operations are called without an argument.
+        read_only operations never change the workspace, network operations need the REST API and
+        batch operations can be run from operations.
+    """
+    def register(method):
+        OPERATIONS[name or method.__name__] = dict(method=method.__name__, spec=spec, read_only=read_only,
+                                                   network=network, batch=batch)
+        return method
+    return register
+
+
+def dict_spec(**options):
+    """
+        The spec of a dict operation parameter with its options
+    """
+    return dict(type='dict', options=options)
+
+
+def required(option_type='str', **spec):
+    return dict(spec, type=option_type, required=True)
+
+
+def vmdb_spec(cache, **options):
+    """
+        The spec of an operation getting vmdb objects, with the query, projection and cache options
+    """
+    return dict_spec(attributes=dict(type='list', elements='str'),
+                     expand=dict(type='list', elements='str'),
+                     projection=dict(type='list', elements='str'),
+                     cache=dict(type='bool', default=cache),
+                     **options)
+
+
+def initialize_options():
+    """
+        The options of initialize_workspace, also taken by initialize_workspaces
+    """
+    return dict(auto_commit=dict(type='bool', default=False),
+                lazy=dict(type='bool', default=False),
+                checkpoint=dict(type='bool', default=False),
+                checkpoint_path=dict(type='path'),
+                resume=dict(type='bool', default=False))
+
+
+def operation_argument_spec():
+    """
+        The argument spec of every registered operation
+    """
+    return dict((name, dict(registered['spec'], required=False)) for name, registered in OPERATIONS.items())
+
+
+def requested_operations(params):
+    """
+        The names of the operations given in the params
+    """
+    return [name for name in OPERATIONS if params.get(name)]
+
+
+def local_operation(name):
+    """
+        Whether the operation can be answered from a workspace with its input loaded
+    """
+    return name in OPERATIONS and OPERATIONS[name]['read_only'] and not OPERATIONS[name]['network']
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+class LimitedReader(object):
+    """
+        A response stream raising ResponseTooLarge once more than limit bytes have been read from it
+    """
+
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self._remaining = limit
+
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining + 1
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise ResponseTooLarge()
+        return data
+
+
+class ConnectionPool(object):
+    """
+        Keep-alive HTTP(S) connections shared by every request made from this process
+
+        The pool lives as long as the module process, so it only saves handshakes for tasks
+        making several requests, like operations, get_vmdb_objects or get_vmdb_collection
+    """
+
+    def __init__(self):
+        self._idle = dict()
+        self._lock = threading.Lock()
+
+
+    def _acquire(self, key):
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                return connections.pop()
+        return None
+
+
+    def _release(self, key, connection):
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+
+
+    def _connect(self, parts, ssl_context):
+        from ansible.module_utils.six.moves import http_client
+        if parts.scheme == 'https':
+            return http_client.HTTPSConnection(parts.hostname, parts.port, timeout=DEFAULT_TIMEOUT, context=ssl_context)
+        return http_client.HTTPConnection(parts.hostname, parts.port, timeout=DEFAULT_TIMEOUT)
+
+
+    def request(self, method, url, data, headers, ssl_context, reader=None, max_size=None):
+        """
+            Send the request over a pooled connection
+
+            Returns the status, reason, lowercased headers and body of the response,
+            or what reader returns for the response stream of a successful request.
+            Raises ResponseTooLarge when the body is over max_size bytes.
+        """
+        import socket
+        from ansible.module_utils.six.moves import http_client
+        parts = urlparse(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path
+        if parts.query:
+            path += '?' + parts.query
+
+        while True:
+            connection = self._acquire(key)
+            reused = connection is not None
+            if not reused:
+                connection = self._connect(parts, ssl_context)
+            try:
+                connection.request(method.upper(), path, data, headers)
+                response = connection.getresponse()
+                stream = response
+                if max_size:
+                    if response.length is not None and response.length > max_size:
+                        raise ResponseTooLarge()
+                    stream = LimitedReader(response, max_size)
+                if reader is not None and response.status < 300:
+                    body = reader(stream)
+                    # Drain whatever the reader left so the connection can be reused
+                    stream.read()
+                else:
+                    body = stream.read()
+            except ResponseTooLarge:
+                connection.close()
+                raise
+            except (http_client.HTTPException, socket.error):
+                connection.close()
+                # An idle connection may have been closed by the server, retry on a new one
+                if reused:
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+            headers = dict((k.lower(), v) for k, v in response.getheaders())
+            return response.status, response.reason, headers, body
+
+
+CONNECTION_POOL = ConnectionPool()
+SSL_CONTEXTS = dict()
+# The lock of each token file, shared by the Workspaces of a fan out so only one of them gets a token
+TOKEN_LOCKS = dict()
+
+
+def make_private_dirs(directory):
+    """
+        Create the directory readable only by the user, when another fork has not just done so
+    """
+    try:
+        os.makedirs(directory, 0o700)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+
+
+def write_json_atomic(path, value):
+    """
+        Write the value as JSON to a private temporary file and move it over the path
+    """
+    import tempfile
+    directory = os.path.dirname(path)
+    make_private_dirs(directory)
+    handle, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'w') as json_file:
+        json.dump(value, json_file)
+    os.rename(tmp_path, path)
+
+
+class CircuitBreaker(object):
+    """
+        Fail fast once an appliance has failed threshold times in a row, shared by all forks through a flock()ed state file
+
+        After timeout seconds one request is let through to probe the appliance again
+    """
+
+    def __init__(self, path, url, threshold, timeout):
+        self._directory = os.path.expanduser(path)
+        self._path = os.path.join(self._directory, 'circuit_%s.json' % hashlib.sha1(url.encode('utf-8')).hexdigest())
+        self._threshold = threshold
+        self._timeout = timeout
+        # Serializes the threads of this fork where flock() is not available
+        self._lock = threading.Lock()
+
+
+    def _update(self, change):
+        """
+            Read, change and write back the state while holding the lock of the state file
+
+            change returns its result and the new state, or None to leave the state as it is
+        """
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        with self._lock:
+            make_private_dirs(self._directory)
+            handle = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    state = json.loads(os.read(handle, 4096).decode('utf-8'))
+                except ValueError:
+                    state = dict(failures=0, opened=None)
+                result, state = change(state)
+                if state is not None:
+                    os.lseek(handle, 0, os.SEEK_SET)
+                    os.ftruncate(handle, 0)
+                    os.write(handle, json.dumps(state).encode('utf-8'))
+                return result
+            finally:
+                os.close(handle)
+
+
+    def allow(self):
+        """
+            Whether a request may be sent
+        """
+        if self._threshold <= 0:
+            return True
+
+        def change(state):
+            if state['opened'] is None:
+                return True, None
+            if time.time() - state['opened'] < self._timeout:
+                return False, None
+            # Half open, let this request probe the appliance and hold the others back
+            state['opened'] = time.time()
+            return True, state
+
+        return self._update(change)
+
+
+    def record(self, success):
+        if self._threshold <= 0:
+            return
+
+        def change(state):
+            if success:
+                if state['failures'] or state['opened'] is not None:
+                    return None, dict(failures=0, opened=None)
+                return None, None
+            state['failures'] += 1
+            if state['failures'] >= self._threshold:
+                state['opened'] = time.time()
+            return None, state
+
+        self._update(change)
+
+
+class TokenCache(object):
+    """
+        API tokens from /api/auth kept on disk, readable only by the user, until shortly before they expire
+
+        Entries are keyed by url and username and only returned for the password they were issued for
+    """
+
+    def __init__(self, path, url, username, password):
+        identity = '%s|%s' % (url, username)
+        self._path = os.path.join(os.path.expanduser(path), 'token_%s.json' % hashlib.sha256(identity.encode('utf-8')).hexdigest())
+        self._password = password or ''
+        self.lock = TOKEN_LOCKS.setdefault(self._path, threading.Lock())
+
+
+    def _check(self, salt):
+        return hashlib.sha256(('%s|%s' % (salt, self._password)).encode('utf-8')).hexdigest()
+
+
+    def get(self):
+        """
+            The cached token, or None when there is none for this password or it is about to expire
+        """
+        try:
+            with open(self._path) as token_file:
+                entry = json.load(token_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get('check') != self._check(entry.get('salt')):
+            return None
+        if entry['expires'] - TOKEN_EXPIRY_MARGIN <= time.time():
+            return None
+        return entry['token']
+
+
+    def put(self, token, ttl):
+        salt = hashlib.sha256(os.urandom(16)).hexdigest()
+        write_json_atomic(self._path, dict(token=token, expires=time.time() + ttl, salt=salt, check=self._check(salt)))
+
+
+    def clear(self):
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+
+class Throttle(object):
+    """
+        Token bucket rate limit and concurrency cap on the requests to an appliance, shared by all forks through lock files
+
+        Concurrency slots are flock()ed files, released by the kernel if the holder dies
+    """
+
+    def __init__(self, path, url, rate, burst, max_concurrency):
+        if rate or max_concurrency:
+            try:
+                import fcntl  # noqa: F401
+            except ImportError:
+                rate = max_concurrency = None
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        self._directory = os.path.expanduser(path)
+        self._bucket_path = os.path.join(self._directory, 'bucket_%s.lock' % key)
+        self._slot_path = os.path.join(self._directory, 'slot_%s_%%d.lock' % key)
+        self._rate = rate
+        self._burst = burst or max(1, rate or 0)
+        self._max_concurrency = max_concurrency
+
+
+    def _open(self, path):
+        make_private_dirs(self._directory)
+        return os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+
+    def _take_token(self):
+        """
+            Take a token from the bucket, returning 0 or the seconds to wait for the next one
+        """
+        import fcntl
+        handle = self._open(self._bucket_path)
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            now = time.time()
+            try:
+                state = json.loads(os.read(handle, 4096).decode('utf-8'))
+            except ValueError:
+                state = dict(tokens=self._burst, updated=now)
+            tokens = min(self._burst, state['tokens'] + (now - state['updated']) * self._rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self._rate
+            os.lseek(handle, 0, os.SEEK_SET)
+            os.ftruncate(handle, 0)
+            os.write(handle, json.dumps(dict(tokens=tokens, updated=now)).encode('utf-8'))
+            return wait
+        finally:
+            os.close(handle)
+
+
+    def acquire(self):
+        """
+            Wait for a token and a free concurrency slot
+
+            Returns the slot to release once the request is done
+        """
+        if self._rate:
+            wait = self._take_token()
+            while wait:
+                time.sleep(wait)
+                wait = self._take_token()
+        if not self._max_concurrency:
+            return None
+
+        import fcntl
+        delay = 0.01
+        while True:
+            for index in range(self._max_concurrency):
+                handle = self._open(self._slot_path % index)
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return handle
+                except (IOError, OSError):
+                    os.close(handle)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+    def release(self, slot):
+        if slot is not None:
+            os.close(slot)
+
+
+class Profile(object):
+    """
+        Per phase timings and HTTP counters reported with profile: true
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = dict()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.http_time = 0.0
+        self.status_codes = dict()
+
+
+    def phase(self, name, started):
+        self.phases[name] = round(time.time() - started, 6)
+
+
+    def record_request(self, started, data, body, info):
+        if isinstance(body, (bytes, str)):
+            received = len(body)
+        else:
+            received = int(info.get('content-length') or 0)
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += len(data or b'')
+            self.bytes_received += received
+            self.http_time += time.time() - started
+            self.status_codes[str(info['status'])] = self.status_codes.get(str(info['status']), 0) + 1
+
+
+    def result(self):
+        return dict(phases=self.phases,
+                    http=dict(requests=self.requests,
+                              bytes_sent=self.bytes_sent,
+                              bytes_received=self.bytes_received,
+                              time=round(self.http_time, 6),
+                              status_codes=self.status_codes))
+
+
+class WorkspaceView(object):
+    """
+        Copy-on-write view of a workspace
+
+        Changing a value shallow copies only the dicts and lists on its path, the first time,
+        so the workspace it was made from is never changed and the rest of the tree is shared
+    """
+    __slots__ = ('root', '_owned')
+
+    def __init__(self, root):
+        self.root = root
+        # The containers copied by this view, kept alive so their ids are not reused
+        self._owned = dict()
+
+
+    def _own(self, node):
+        if id(node) in self._owned:
+            return node
+        node = copy.copy(node) if node is not None else dict()
+        self._owned[id(node)] = node
+        return node
+
+
+    def container(self, path):
+        """
+            The dict or list at the path, copied on the way so it can be changed in place
+
+            Missing dicts on the path are created
+        """
+        self.root = node = self._own(self.root)
+        for key in path:
+            child = self._own(node.get(key) if isinstance(node, dict) else node[key])
+            node[key] = child
+            node = child
+        return node
+
+
+    def set(self, path, value):
+        self.container(path[:-1])[path[-1]] = value
+
+
+def workspace_hash(workspace):
+    """
+        A content hash of the workspace used to check a delta applies to the same base
+    """
+    return hashlib.sha1(json.dumps(workspace, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def workspace_diff(old, new, path=None):
+    """
+        The changes turning the old workspace into the new one
+
+        Returns a dict of set [path, value] pairs and removed paths
+    """
+    path = path or []
+    changes = dict(set=[], removed=[])
+    for key, value in new.items():
+        if key in old and old[key] is value:
+            # A branch shared with the base through a WorkspaceView is unchanged
+            continue
+        if key in old and isinstance(value, dict) and isinstance(old[key], dict):
+            child = workspace_diff(old[key], value, path + [key])
+            changes['set'].extend(child['set'])
+            changes['removed'].extend(child['removed'])
+        elif key not in old or old[key] != value:
+            changes['set'].append([path + [key], value])
+    for key in old:
+        if key not in new:
+            changes['removed'].append(path + [key])
+    return changes
+
+
+def apply_workspace_diff(workspace, changes):
+    """
+        Apply the changes from workspace_diff to a copy of the workspace sharing its unchanged branches
+    """
+    view = WorkspaceView(workspace)
+    for path, value in changes['set']:
+        view.set(path, value)
+    for path in changes['removed']:
+        del view.container(path[:-1])[path[-1]]
+    return view.root
+
+
+def delta_result(result, base, base_hash=None):
+    """
+        Replace the workspace in the result with the changes made to the base workspace
+    """
+    if 'workspace' not in result or base is None:
+        return result
+    result = dict(result)
+    result['workspace_delta'] = dict(base=base_hash or workspace_hash(base), changes=workspace_diff(base, result.pop('workspace')))
+    return result
+
+
+def load_sections(stream, sections):
+    """
+        Decode only the top level sections of a JSON object from a stream
+
+        Uses ijson to skip building the other sections when it is installed
+    """
+    try:
+        import ijson
+    except ImportError:
+        value = json.load(stream)
+        return dict((key, value[key]) for key in sections if key in value)
+
+    value = dict()
+    key = builder = None
+    for prefix, event, event_value in ijson.parse(stream, use_float=True):
+        if prefix == '':
+            if builder is not None:
+                value[key] = builder.value
+                builder = None
+            if event == 'map_key' and event_value in sections:
+                key = event_value
+                builder = ijson.common.ObjectBuilder()
+        elif builder is not None:
+            builder.event(event, event_value)
+    return value
+
+
+class ProjectionError(Exception):
+    pass
+
+
+def list_index(key):
+    """
+        The list index a projection path key names, or None when it is not a non negative integer
+    """
+    try:
+        return int(key) if key.isdigit() else None
+    except ValueError:
+        return None
+
+
+def merge_projection(first, second):
+    """
+        Merge two projection trees of the same list item, e.g. from disks.1.size and disks.01.name
+    """
+    if first is None or second is None:
+        return None
+    merged = dict(first)
+    for key, child in second.items():
+        merged[key] = merge_projection(merged[key], child) if key in merged else child
+    return merged
+
+
+def project(value, paths):
+    """
+        Keep only the dotted paths, e.g. hardware.cpu_total_cores or disks.0.size, of a decoded response
+
+        Numeric keys pick list items, which stay a list in index order. Missing dict keys are left out,
+        a key that is not an index of a list or is out of its range raises ProjectionError.
+    """
+    # A tree of the path keys, None marking a path kept whole
+    tree = dict()
+    for path in paths:
+        node = tree
+        keys = path.split('.')
+        for key in keys[:-1]:
+            if node.get(key, dict()) is None:
+                break
+            node = node.setdefault(key, dict())
+        else:
+            node[keys[-1]] = None
+
+    missing = object()
+
+    def pick(source, node, path):
+        if node is None:
+            return source
+        if isinstance(source, list):
+            items = dict()
+            for key, child in node.items():
+                index = list_index(key)
+                if index is None:
+                    raise ProjectionError('The projection path %s does not index a list' % '.'.join(path + [key]))
+                if index >= len(source):
+                    raise ProjectionError('The projection path %s is out of range of a list of %d items'
+                                          % ('.'.join(path + [key]), len(source)))
+                # Zero padded keys, like 01, name the same item as 1
+                items[index] = merge_projection(items[index], child) if index in items else child
+            picked = [pick(source[index], items[index], path + [str(index)]) for index in sorted(items)]
+            picked = [item for item in picked if item is not missing]
+        elif isinstance(source, dict):
+            picked = dict((key, pick(source[key], child, path + [key])) for key, child in node.items() if key in source)
+            picked = dict((key, item) for key, item in picked.items() if item is not missing)
+        else:
+            return missing
+        return picked if picked else missing
+
+    projected = pick(value, tree, [])
+    return dict() if projected is missing else projected
+
+
+class VmdbCache(object):
+    """
+        On disk LRU cache of vmdb object responses keyed by url and credentials
+    """
+
+    def __init__(self, path, ttl, size, identity):
+        self._path = os.path.expanduser(path)
+        self._ttl = ttl
+        self._size = size
+        self._identity = identity
+        make_private_dirs(self._path)
+
+
+    def _file(self, url):
+        key = hashlib.sha256(('%s|%s' % (self._identity, url)).encode('utf-8')).hexdigest()
+        return os.path.join(self._path, key + '.json')
+
+
+    def get(self, url):
+        """
+            The cached entry for the url, or None
+        """
+        try:
+            with open(self._file(url)) as cache_file:
+                entry = json.load(cache_file)
+            os.utime(self._file(url), None)
+        except (IOError, OSError, ValueError):
+            return None
+        return entry
+
+
+    def fresh(self, entry):
+        return time.time() - entry['fetched'] < self._ttl
+
+
+    def put(self, url, body, etag=None):
+        """
+            Atomically write the entry for the url and evict the least recently used entries
+        """
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        write_json_atomic(self._file(url), dict(fetched=time.time(), etag=etag, body=body))
+        self._evict()
+
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self._path):
+            if name.endswith('.json'):
+                path = os.path.join(self._path, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        entries.sort()
+        for _mtime, path in entries[:max(len(entries) - self._size, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class WorkspaceError(Exception):
+    pass
+
+
+class FanOutModule(object):
+    """
+        Wraps the AnsibleModule for one workspace of a fan out, raising failures instead of exiting
+    """
+
+    def __init__(self, module):
+        self._module = module
+
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+    def fail_json(self, **kwargs):
+        raise WorkspaceError(kwargs.get('msg'))
+
+
+class ProfiledModule(object):
+    """
+        Wraps the AnsibleModule to report the profile with failures too, like timeouts or an open circuit
+    """
+
+    def __init__(self, module, profile):
+        self._module = module
+        self._profile = profile
+        self.operation_started = None
+
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+    def fail_json(self, **kwargs):
+        if self.operation_started is not None:
+            self._profile.phase('operation', self.operation_started)
+        self._module.fail_json(profile=self._profile.result(), **kwargs)
+
+
+def error_message(error):
+    """
+        The message reporting the failure of one item of a concurrent operation
+    """
+    if isinstance(error, WorkspaceError):
+        return str(error)
+    return '%s: %s' % (type(error).__name__, error)
 
 
 class ManageIQAutomate(object):
@@ -43,57 +848,377 @@ class ManageIQAutomate(object):
         Object to execute automate workspace management operations in manageiq.
     """
 
-    def __init__(self, module, workspace):
-        self._target = workspace
+    def __init__(self, module, workspace, automate_workspace=None):
+        self._view = WorkspaceView(workspace)
         self._module = module
+        self._automate_workspace = automate_workspace
+        if automate_workspace is None and isinstance(workspace, dict):
+            options = (workspace.get('workspace') or dict()).get('options') or dict()
+            self._automate_workspace = options.get('automate_workspace')
         self._api_url = self._module.params['manageiq_connection']['url'] + '/api'
         self._auth = self._build_auth()
+        self._batch = False
+        self.input_loaded = False
+        self.profile = None
+
+
+    @property
+    def _target(self):
+        return self._view.root
 
 
     def _build_auth(self):
         self._headers = {'Content-Type': 'application/json; charset=utf-8'}
+        self._token_cache = None
+        connection = self._module.params['manageiq_connection']
         # Force CERT validation to work with fetch_url
         self._module.params['validate_certs'] = self._module.params['manageiq_connection']['manageiq_validate_certs']
         for cert in ('force_basic_auth', 'client_cert', 'client_key'):
             self._module.params[cert] = self._module.params['manageiq_connection'][cert]
         if self._module.params['manageiq_connection'].get('token'):
             self._headers["X-Auth-Token"] = self._module.params['manageiq_connection']['token']
+        elif connection.get('cache_token') and connection.get('username'):
+            # The credentials are only sent to /api/auth, the requests use the token it returns
+            self._token_cache = TokenCache(connection.get('token_cache_path') or DEFAULT_TOKEN_CACHE_PATH,
+                                           connection['url'], connection['username'], connection.get('password'))
         else:
             self._module.params['url_username'] = self._module.params['manageiq_connection']['username']
             self._module.params['url_password'] = self._module.params['manageiq_connection']['password']
 
 
+    def _ssl_context(self, url):
+        """
+            The SSL context used by the keep-alive connections, shared by every Workspace in the process
+        """
+        if not url.startswith('https'):
+            return None
+        key = (self._module.params['validate_certs'], self._module.params['client_cert'], self._module.params['client_key'])
+        if key not in SSL_CONTEXTS:
+            import ssl
+            context = ssl.create_default_context()
+            if not self._module.params['validate_certs']:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            if self._module.params['client_cert']:
+                context.load_cert_chain(self._module.params['client_cert'], self._module.params['client_key'])
+            SSL_CONTEXTS[key] = context
+        return SSL_CONTEXTS[key]
+
+
+    def _keep_alive_headers(self):
+        """
+            The request headers including basic auth, which fetch_url adds on its own
+        """
+        headers = dict(self._headers)
+        if 'X-Auth-Token' not in headers and self._module.params.get('url_username'):
+            import base64
+            credentials = '%s:%s' % (self._module.params['url_username'], self._module.params['url_password'] or '')
+            headers['Authorization'] = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        return headers
+
+
+    def authenticate(self, refresh=False):
+        """
+            Set the X-Auth-Token header from the token cache, getting a new token from /api/auth
+            when there is none, it is about to expire or it was refused
+
+            Returns None, or the info of the failed /api/auth request
+        """
+        with self._token_cache.lock:
+            if refresh:
+                self._token_cache.clear()
+            elif 'X-Auth-Token' in self._headers:
+                return None
+            self._headers.pop('X-Auth-Token', None)
+            token = self._token_cache.get()
+            if token is None:
+                import base64
+                connection = self._module.params['manageiq_connection']
+                credentials = '%s:%s' % (connection['username'], connection.get('password') or '')
+                headers = {'Authorization': 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')}
+                body, info = self._send('get', self._api_url + '/auth', None, headers, None)
+                if body is None:
+                    return info
+                auth = json.loads(body)
+                token = auth['auth_token']
+                self._token_cache.put(token, auth.get('token_ttl') or DEFAULT_TOKEN_TTL)
+            self._headers['X-Auth-Token'] = token
+        return None
+
+
+    def _send_authenticated(self, method, url, data, headers, reader):
+        """
+            Send the request with the cached API token when cache_token is on, getting a new token once if it is refused
+        """
+        if self._token_cache is None:
+            return self._send(method, url, data, headers, reader)
+        for refresh in (False, True):
+            failure = self.authenticate(refresh)
+            if failure is not None:
+                return None, failure
+            body, info = self._send(method, url, data, headers, reader)
+            if info['status'] != 401:
+                break
+        return body, info
+
+
+    def keep_alive(self, url):
+        """
+            Use the connection pool when enabled and the url does not go through a proxy
+        """
+        if not self._module.params['manageiq_connection'].get('keep_alive'):
+            return False
+        from ansible.module_utils.six.moves.urllib.request import getproxies, proxy_bypass
+        parts = urlparse(url)
+        if getattr(self, '_proxies', None) is None:
+            self._proxies = getproxies()
+        if parts.scheme not in self._proxies:
+            return True
+        return bool(proxy_bypass(parts.hostname))
+
+
+    def send(self, method, url, data=None, headers=None, reader=None):
+        """
+            Send a request to the REST API without failing the module
+
+            Returns the body, or what reader returns for the response stream, or None on error or 304,
+            and a dict with the status, msg and lowercased headers
+        """
+        connection = self._module.params['manageiq_connection']
+        retries = connection.get('retries')
+        if retries is None:
+            retries = DEFAULT_RETRIES
+        # A 429 was refused before it ran, so only it is retried for a POST unless retry_posts is set
+        retry_status_codes = RETRY_STATUS_CODES
+        if method.lower() not in IDEMPOTENT_METHODS and not connection.get('retry_posts'):
+            retry_status_codes = (429,)
+        breaker = self.circuit_breaker()
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                return None, dict(status=-1, msg='Circuit breaker open for %s after repeated failures' % connection['url'])
+            throttle = self.throttle()
+            slot = throttle.acquire()
+            try:
+                started = time.time()
+                body, info = self._send_authenticated(method, url, data, headers, reader)
+            finally:
+                throttle.release(slot)
+            if self.profile is not None:
+                self.profile.record_request(started, data, body, info)
+            transient = body is None and info['status'] in RETRY_STATUS_CODES and info.get('retry', True)
+            breaker.record(not transient)
+            if not transient or info['status'] not in retry_status_codes or attempt >= retries:
+                return body, info
+            time.sleep(self.retry_delay(attempt, info))
+            attempt += 1
+
+
+    def retry_delay(self, attempt, info):
+        """
+            Jittered exponential backoff, or the Retry-After the appliance asked for
+        """
+        connection = self._module.params['manageiq_connection']
+        max_backoff = connection.get('retry_max_backoff')
+        if max_backoff is None:
+            max_backoff = DEFAULT_RETRY_MAX_BACKOFF
+        try:
+            return min(float(info['retry-after']), max_backoff)
+        except (KeyError, TypeError, ValueError):
+            pass
+        import random
+        backoff = connection.get('retry_backoff')
+        if backoff is None:
+            backoff = DEFAULT_RETRY_BACKOFF
+        return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+
+    def circuit_breaker(self):
+        """
+            The circuit breaker of the appliance url
+        """
+        if getattr(self, '_circuit_breaker', None) is None:
+            connection = self._module.params['manageiq_connection']
+            threshold = connection.get('circuit_breaker_threshold')
+            if threshold is None:
+                threshold = DEFAULT_CIRCUIT_BREAKER_THRESHOLD
+            timeout = connection.get('circuit_breaker_timeout')
+            if timeout is None:
+                timeout = DEFAULT_CIRCUIT_BREAKER_TIMEOUT
+            self._circuit_breaker = CircuitBreaker(connection.get('state_path') or DEFAULT_STATE_PATH, connection['url'],
+                                                   threshold, timeout)
+        return self._circuit_breaker
+
+
+    def throttle(self):
+        """
+            The rate limit and concurrency cap of the appliance url
+        """
+        if getattr(self, '_throttle', None) is None:
+            connection = self._module.params['manageiq_connection']
+            self._throttle = Throttle(connection.get('state_path') or DEFAULT_STATE_PATH, connection['url'],
+                                      connection.get('rate_limit'), connection.get('rate_burst'), connection.get('max_concurrency'))
+        return self._throttle
+
+
+    def map_concurrently(self, func, items, workers):
+        """
+            Call func on each item from a pool of up to workers threads, returning the results in order
+        """
+        from multiprocessing.pool import ThreadPool
+        if self.keep_alive(self._api_url):
+            # Build the shared SSL context once before the threads race to do it
+            self._ssl_context(self._api_url)
+        pool = ThreadPool(min(int(workers or DEFAULT_WORKERS), len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+
+
+    def _send(self, method, url, data, headers, reader):
+        import socket
+        import ssl
+        from ansible.module_utils.six.moves import http_client
+        from ansible.module_utils.urls import fetch_url
+        max_size = self._module.params['manageiq_connection'].get('max_response_size')
+        too_large = dict(status=-1, retry=False,
+                         msg='The response from %s is larger than max_response_size %s bytes' % (url, max_size))
+        request_headers = dict(self._headers, **(headers or dict()))
+        if self.keep_alive(url):
+            if data is not None:
+                data = data.encode('utf-8')
+            request_headers.update(self._keep_alive_headers())
+            try:
+                status, reason, response_headers, body = CONNECTION_POOL.request(method, url, data, request_headers, self._ssl_context(url),
+                                                                                 reader, max_size)
+            except ResponseTooLarge:
+                return None, too_large
+            except (http_client.HTTPException, socket.error, ssl.SSLError) as error:
+                return None, dict(status=-1, msg='Request failed: %s' % error)
+            info = dict(response_headers, status=status, msg='OK')
+            if status == 304 or status >= 400:
+                info['msg'] = 'Status code was %s: %s' % (status, reason)
+                return None, info
+            return body, info
+
+        result, info = fetch_url(self._module, url, data, request_headers, method)
+        if result is None or info['status'] == 304 or info['status'] >= 400:
+            return None, info
+        if max_size:
+            if int(info.get('content-length') or 0) > max_size:
+                return None, too_large
+            result = LimitedReader(result, max_size)
+        try:
+            if reader is not None:
+                return reader(result), info
+            return result.read(), info
+        except ResponseTooLarge:
+            return None, too_large
+
+
+    def vmdb_cache(self):
+        """
+            The vmdb object cache, or None when it is not enabled
+        """
+        connection = self._module.params['manageiq_connection']
+        if not connection.get('vmdb_cache'):
+            return None
+        if getattr(self, '_vmdb_cache', None) is None:
+            identity = '%s|%s|%s' % (connection.get('username'), connection.get('token'), connection.get('group'))
+            ttl = connection.get('vmdb_cache_ttl')
+            if ttl is None:
+                ttl = DEFAULT_VMDB_CACHE_TTL
+            self._vmdb_cache = VmdbCache(connection.get('vmdb_cache_path') or DEFAULT_VMDB_CACHE_PATH, ttl,
+                                         connection.get('vmdb_cache_size') or DEFAULT_VMDB_CACHE_SIZE,
+                                         hashlib.sha256(identity.encode('utf-8')).hexdigest())
+        return self._vmdb_cache
+
+
+    def send_cached(self, url, use_cache=True, sections=None):
+        """
+            Get from the REST API through the vmdb cache, revalidating stale entries with their ETag
+
+            Uncached responses only decode the given top level sections
+        """
+        cache = self.vmdb_cache() if use_cache else None
+        if cache is None:
+            if sections:
+                return self.send('get', url, reader=lambda stream: load_sections(stream, sections))
+            return self.send('get', url)
+
+        entry = cache.get(url)
+        if entry is not None and cache.fresh(entry):
+            return entry['body'], dict(status=200, msg='OK (cached)')
+        headers = None
+        if entry is not None and entry.get('etag'):
+            headers = {'If-None-Match': entry['etag']}
+
+        body, info = self.send('get', url, headers=headers)
+        if info['status'] == 304:
+            cache.put(url, entry['body'], entry['etag'])
+            return entry['body'], dict(info, status=200, msg='OK (revalidated)')
+        if body is not None:
+            cache.put(url, body, info.get('etag'))
+        return body, info
+
+
+    def request(self, method, url, data=None):
+        """
+            Send a request to the REST API and return the decoded JSON response
+        """
+        body, info = self.send(method, url, data)
+        if body is None:
+            self._module.fail_json(msg=info['msg'], status=info['status'])
+        return json.loads(body)
+
 
     def url(self):
         """
             The url to connect to the workspace
         """
-        url_str = self._module.params['manageiq_connection']['automate_workspace']
+        url_str = self._automate_workspace or self._module.params['manageiq_connection']['automate_workspace']
         if url_str is None:
             self._module.fail_json(msg='Required parameter \'automate_workspace\' is not specified')
         return self._api_url + '/' + url_str
 
-    def href_slug_url(self, value):
+    def href_slug_url(self, value, dict_options=None):
         """
             The url to connect to the vmdb
+
+            The attributes, expand, offset and limit options are sent as query parameters
         """
-        base_url = value.split('::')[1]
+        base_url = value.split('::')[-1]
+        query = []
+        for param in ('attributes', 'expand', 'offset', 'limit'):
+            param_value = (dict_options or dict()).get(param)
+            if param_value:
+                if isinstance(param_value, list):
+                    param_value = ','.join(param_value)
+                query.append((param, param_value))
+        if query:
+            base_url += ('&' if '?' in base_url else '?') + urlencode(query)
         return self._api_url + '/' + base_url
 
 
-    def get(self, alt_url=None):
+    def get(self, alt_url=None, sections=None):
         """
             Get any attribute, object from the REST API
+
+            When sections are given only those top level keys are decoded from the response stream
         """
         if alt_url:
             url = alt_url
         else:
             url = self.url()
 
-        result, _info = fetch_url(self._module, url, None, self._headers, 'get')
-        if result is None:
-            self._module.fail_json(msg=_info['msg'])
-        return json.loads(result.read())
+        if sections:
+            value, info = self.send('get', url, reader=lambda stream: load_sections(stream, sections))
+            if value is None:
+                self._module.fail_json(msg=info['msg'], status=info['status'])
+            return value
+        return self.request('get', url)
 
 
     def set(self, data):
@@ -101,8 +1226,7 @@ class ManageIQAutomate(object):
             Set any attribute, object from the REST API
         """
         post_data = json.dumps(dict(action='edit', resource=data))
-        result, _info = fetch_url(self._module, self.url(), post_data, self._headers, 'post')
-        return  json.loads(result.read())
+        return self.request('post', self.url(), post_data)
 
 
     def encrypt(self, data):
@@ -110,8 +1234,7 @@ class ManageIQAutomate(object):
             Set any attribute, object from the REST API
         """
         post_data = json.dumps(dict(action='encrypt', resource=data))
-        result, _info = fetch_url(self._module, self.url(), post_data, self._headers, 'post')
-        return  json.loads(result.read())
+        return self.request('post', self.url(), post_data)
 
 
     def decrypt(self, data):
@@ -119,8 +1242,51 @@ class ManageIQAutomate(object):
             Decrypt any attribute, object from the REST API
         """
         post_data = json.dumps(dict(action='decrypt', resource=data))
-        result, _info = fetch_url(self._module, self.url(), post_data, self._headers, 'post')
-        return  json.loads(result.read())
+        return self.request('post', self.url(), post_data)
+
+
+    def bulk_action(self, action, resources):
+        """
+            Run an action on several resources in one request from the REST API
+
+            Returns the results in the same order as the resources
+        """
+        post_data = json.dumps(dict(action=action, resources=resources))
+        return self.request('post', self.url(), post_data)['results']
+
+
+    def workspace_input(self):
+        """
+            The workspace input, fetched on first use when the workspace was initialized lazily
+        """
+        workspace = (self._target or dict()).get('workspace', dict())
+        if 'input' not in workspace and workspace.get('options', dict()).get('lazy'):
+            self._view.set(['workspace', 'input'], self.get(self.url() + '?attributes=input', ['input']).get('input', dict()))
+            self.input_loaded = True
+            return self._target['workspace']['input']
+        return workspace.get('input')
+
+
+    def input_set(self, keys, value):
+        """
+            Set a value in the workspace input, fetching it first when it is loaded lazily
+        """
+        self.workspace_input()
+        self._view.set(['workspace', 'input'] + keys, value)
+
+
+    def lookup(self, path):
+        """
+            Find the value at a '|' joined path
+
+            Returns whether the path was found and its value
+        """
+        if path.startswith('workspace|input'):
+            self.workspace_input()
+        try:
+            return True, functools.reduce(operator.getitem, path.split("|"), self._target)
+        except (KeyError, TypeError):
+            return False, None
 
 
     def exists(self, path, allow_null=False):
@@ -129,15 +1295,12 @@ class ManageIQAutomate(object):
 
             If allow_null is true then return True or fail on a KeyError
         """
-        list_path = path.split("|")
-
-        try:
-            reduced_str = functools.reduce(operator.getitem, list_path, self._target)
-            if allow_null and not reduced_str:
-                return True
-            return bool(reduced_str)
-        except KeyError as error:
+        found, reduced_str = self.lookup(path)
+        if not found:
             return False
+        if allow_null and not reduced_str:
+            return True
+        return bool(reduced_str)
 
 
     def auto_commit(self):
@@ -165,21 +1328,66 @@ class Workspace(ManageIQAutomate):
         """
             Commit the workspace or return the current version
         """
-        if self.auto_commit():
+        if self.auto_commit() and not self._batch:
             return self.commit_workspace()
+        if not self._batch:
+            self.write_checkpoint(self._target['workspace'])
         return dict(changed=True, workspace=self._target['workspace'])
 
 
+    def checkpoint_file(self, path):
+        """
+            The checkpoint file of this automate workspace
+        """
+        key = hashlib.sha1(self.url().encode('utf-8')).hexdigest()
+        return os.path.join(os.path.expanduser(path), key + '.json')
+
+
+    def write_checkpoint(self, workspace):
+        """
+            Atomically replace the local checkpoint of the workspace when checkpoints are enabled
+        """
+        path = (workspace.get('options') or dict()).get('checkpoint')
+        if path:
+            write_json_atomic(self.checkpoint_file(path), workspace)
+
+
+    def remove_checkpoint(self, workspace):
+        """
+            Remove the local checkpoint of the workspace once its changes are committed
+        """
+        path = (workspace.get('options') or dict()).get('checkpoint')
+        if path:
+            try:
+                os.remove(self.checkpoint_file(path))
+            except OSError:
+                pass
+
+
+    def read_checkpoint(self, path):
+        """
+            The workspace saved in the local checkpoint, or None
+        """
+        try:
+            with open(self.checkpoint_file(path)) as checkpoint_file:
+                return json.load(checkpoint_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+
     def get_real_object_name(self, dict_options):
         if dict_options['object'] == 'current':
             return self.current()
         return dict_options['object']
 
 
+    @operation(dict(type='str'), read_only=True)
     def object_exists(self, dict_options):
         """
             Check if the specific object exists
         """
+        if not isinstance(dict_options, dict):
+            dict_options = dict(object=dict_options)
 
         search_path = "workspace|input|objects|" + self.get_real_object_name(dict_options)
 
@@ -188,6 +1396,7 @@ class Workspace(ManageIQAutomate):
         return dict(changed=False, value=False)
 
 
+    @operation(dict_spec(object=required(), attribute=required()), read_only=True)
     def attribute_exists(self, dict_options):
         """
             Check if the specific attribute exists
@@ -202,6 +1411,7 @@ class Workspace(ManageIQAutomate):
         return dict(changed=False, value=False)
 
 
+    @operation(dict_spec(attribute=required()), read_only=True)
     def state_var_exists(self, dict_options):
         """
             Check if the specific state_var exists
@@ -215,6 +1425,7 @@ class Workspace(ManageIQAutomate):
         return dict(changed=False, value=False)
 
 
+    @operation(dict_spec(parameter=required()), read_only=True)
     def method_parameter_exists(self, dict_options):
         """
             Check if the specific method_parameter exists
@@ -228,137 +1439,307 @@ class Workspace(ManageIQAutomate):
         return dict(changed=False, value=False)
 
 
+    @operation(dict_spec(object=required(), attribute=required()), read_only=True, network=True)
     def get_decrypted_attribute(self, dict_options):
         decrypted_attribute = self.decrypt(dict_options)
         return dict(changed=False, value=decrypted_attribute)
 
 
+    @operation(dict_spec(attribute=required()), read_only=True, network=True)
     def get_decrypted_method_parameter(self, dict_options):
         decrypted_dict = dict(object='method_parameters', attribute=dict_options['attribute'])
         decrypted_attribute = self.decrypt(decrypted_dict)
         return dict(changed=False, value=decrypted_attribute)
 
 
+    @operation(dict_spec(attributes=required('list', elements='dict', options=dict(object=required(), attribute=required()))),
+               read_only=True, network=True)
+    def decrypt_attributes(self, dict_options):
+        """
+            Decrypt several object attributes in one request, keyed by object and attribute
+        """
+        return dict(changed=False, value=self.bulk_attributes('decrypt', dict_options['attributes']))
+
+
+    @operation(dict_spec(attributes=required('list', elements='dict',
+                                             options=dict(object=required(), attribute=required(), value=required(no_log=True)))),
+               network=True)
+    def encrypt_attributes(self, dict_options):
+        """
+            Set several encrypted object attributes in one request, keyed by object and attribute
+        """
+        return dict(changed=True, value=self.bulk_attributes('encrypt', dict_options['attributes']))
+
+
+    def bulk_attributes(self, action, attributes):
+        value = dict()
+        if not attributes:
+            return value
+        results = self.bulk_action(action, attributes)
+        for resource, result in zip(attributes, results):
+            value.setdefault(resource['object'], dict())[resource['attribute']] = result
+        return value
+
+
+    @operation(dict_spec(object=required(), attribute=required()), read_only=True)
     def get_attribute(self, dict_options):
         """
             Get the passed in attribute from the Workspace
         """
 
-        if self.attribute_exists(dict_options)['value']:
-            return_value = self._target['workspace']['input']['objects'][dict_options['object']][dict_options['attribute']]
-
+        search_path = "|".join(["workspace|input|objects", self.get_real_object_name(dict_options), dict_options['attribute']])
+        found, return_value = self.lookup(search_path)
+        if found:
             return dict(changed=False, value=return_value)
         else:
             self._module.fail_json(msg='Object %s Attribute %s does not exist' % (dict_options['object'], dict_options['attribute']))
 
 
+    @operation(dict_spec(attribute=required()), read_only=True)
     def get_state_var(self, dict_options):
         """
             Get the passed in state_var from the Workspace
         """
-        return_value = None
-
-        if self.state_var_exists(dict_options)['value']:
-            return_value = self._target['workspace']['input']['state_vars'][dict_options['attribute']]
-
+        found, return_value = self.lookup("workspace|input|state_vars|" + dict_options['attribute'])
+        if found and return_value:
             return dict(changed=False, value=return_value)
         else:
             self._module.fail_json(msg='State Var %s does not exist' % dict_options['attribute'])
 
 
+    @operation(dict_spec(parameter=required()), read_only=True)
     def get_method_parameter(self, dict_options):
         """
             Get the passed in method_parameter from the Workspace
         """
-        return_value = None
-
-        if self.method_parameter_exists(dict_options)['value']:
-            return_value = self._target['workspace']['input']['method_parameters'][dict_options['parameter']]
-
+        found, return_value = self.lookup("workspace|input|method_parameters|" + dict_options['parameter'])
+        if found and return_value:
             return dict(changed=False, value=return_value)
         else:
             self._module.fail_json(msg='Method Parameter %s does not exist' % dict_options['parameter'])
 
 
+    @operation(dict(type='bool'), read_only=True)
     def get_object_names(self):
         """
             Get a list of all current object names
         """
 
-        return_value = self._target['workspace']['input']['objects'].keys()
+        return_value = list(self.workspace_input()['objects'].keys())
         return dict(changed=False, value=return_value)
 
 
+    @operation(dict(type='bool'), read_only=True)
     def get_method_parameters(self):
         """
             Get a list of all current method_paramters
         """
 
-        return_value = self._target['workspace']['input']['method_parameters']
+        return_value = self.workspace_input()['method_parameters']
         return dict(changed=False, value=return_value)
 
 
+    @operation(dict(type='bool'), read_only=True)
     def get_state_var_names(self):
         """
             Get a list of all current state_var names
         """
 
-        return_value = self._target['workspace']['input']['state_vars'].keys()
+        return_value = list(self.workspace_input()['state_vars'].keys())
         return dict(changed=False, value=return_value)
 
 
+    @operation(dict_spec(object=required()), read_only=True)
     def get_object_attribute_names(self, dict_options):
         """
             Get a list of all object_attribute names
         """
 
-        if self.object_exists(dict_options):
-            return_value = self._target['workspace']['input']['objects'][dict_options['object']].keys()
+        if self.object_exists(dict_options)['value']:
+            return_value = list(self.workspace_input()['objects'][dict_options['object']].keys())
             return dict(changed=False, value=return_value)
         else:
             self._module.fail_json(msg='Object %s does not exist' % dict_options['object'])
 
 
+    @operation(vmdb_spec(True, object=required(), attribute=required()), read_only=True, network=True)
     def get_vmdb_object(self, dict_options):
         """
             Get a vmdb object via an href_slug passed in on an attribute
         """
-        result = self.get_attribute(dict_options)
         attribute = dict_options['attribute']
         obj = dict_options['object']
-        if self.object_exists(dict_options):
-            vmdb_object = self.get(self.href_slug_url(result['value']))
-            return dict(changed=False, value=vmdb_object)
+        found, href = self.lookup("|".join(["workspace|input|objects", self.get_real_object_name(dict_options), attribute]))
+        if self.object_exists(dict_options)['value'] and found and href:
+            body, info = self.send_cached(self.href_slug_url(href, dict_options), dict_options.get('cache', True),
+                                          self.vmdb_sections(dict_options))
+            if body is None:
+                self._module.fail_json(msg=info['msg'], status=info['status'])
+            return dict(changed=False, value=self.vmdb_value(body, dict_options))
         else:
             self._module.fail_json(msg='Attribute %s does not exist for Object %s' % (attribute, obj))
 
 
+    @operation(vmdb_spec(True, objects=required('list', elements='raw'), workers=dict(type='int')), read_only=True, network=True)
+    def get_vmdb_objects(self, dict_options):
+        """
+            Get several vmdb objects concurrently via href_slugs or object attributes holding them
+
+            Objects and errors are keyed the way they were passed in, by href_slug or object|attribute
+        """
+        keys = dict()
+        errors = dict()
+        for item in dict_options['objects']:
+            if not isinstance(item, dict):
+                keys[item] = item
+                continue
+            if not item.get('object') or not item.get('attribute'):
+                self._module.fail_json(msg='Each of objects must be an href_slug or have an object and an attribute, got %s' % item)
+            key = '%s|%s' % (item['object'], item['attribute'])
+            found, href = self.lookup("|".join(["workspace|input|objects", item['object'], item['attribute']]))
+            if found and href:
+                keys[key] = href
+            else:
+                errors[key] = 'Attribute %s does not exist for Object %s' % (item['attribute'], item['object'])
+
+        value = dict()
+        hrefs = list(set(keys.values()))
+        if not hrefs:
+            return dict(changed=False, value=value, errors=errors)
+
+        sections = self.vmdb_sections(dict_options)
+
+        def fetch(href):
+            try:
+                body, info = self.send_cached(self.href_slug_url(href, dict_options), dict_options.get('cache', True), sections)
+                if body is None:
+                    return None, info['msg']
+                return self.vmdb_value(body, dict_options), None
+            except Exception as error:
+                return None, error_message(error)
+
+        # fetch_url fails the module on some errors, which must not exit from a pool thread
+        module = self._module
+        self._module = FanOutModule(module)
+        try:
+            results = dict(zip(hrefs, self.map_concurrently(fetch, hrefs, dict_options.get('workers'))))
+        finally:
+            self._module = module
+        for key, href in keys.items():
+            result, error = results[href]
+            if error is None:
+                value[key] = result
+            else:
+                errors[key] = error
+        return dict(changed=False, value=value, errors=errors)
+
+
+    @operation(dict(vmdb_spec(False, href=dict(type='str'), object=dict(type='str'), attribute=dict(type='str'),
+                              limit=dict(type='int'), offset=dict(type='int'),
+                              max_pages=dict(type='int', default=DEFAULT_MAX_PAGES)),
+                    required_one_of=[['href', 'object']], required_together=[['object', 'attribute']]),
+               read_only=True, network=True)
+    def get_vmdb_collection(self, dict_options):
+        """
+            Get the resources of a vmdb collection via an href_slug, or an object attribute holding one, a page at a time
+
+            Stops after max_pages pages, returning the offset to continue from in next_offset
+        """
+        href = dict_options.get('href')
+        if not href:
+            href = self.get_attribute(dict_options)['value']
+        max_pages = dict_options.get('max_pages')
+        if max_pages is None:
+            max_pages = DEFAULT_MAX_PAGES
+        if max_pages < 1:
+            self._module.fail_json(msg='max_pages must be at least 1, got %s' % max_pages)
+
+        resources = []
+        pages = 0
+        count = next_offset = None
+        for page, page_resources, next_offset in self.collection_pages(href, dict_options):
+            pages += 1
+            count = page.get('subquery_count', page.get('count'))
+            if dict_options.get('projection'):
+                page_resources = [self.vmdb_value(resource, dict_options) for resource in page_resources]
+            resources.extend(page_resources)
+            if pages >= max_pages:
+                break
+        return dict(changed=False, value=resources, count=count, pages=pages, next_offset=next_offset)
+
+
+    def collection_pages(self, href, dict_options):
+        """
+            Yield each page of a vmdb collection with its resources and the offset of the next page,
+            None after the last one
+        """
+        limit = int(dict_options.get('limit') or DEFAULT_PAGE_SIZE)
+        offset = int(dict_options.get('offset') or 0)
+        while True:
+            page_options = dict(dict_options, offset=offset, limit=limit, expand=dict_options.get('expand') or 'resources')
+            body, info = self.send_cached(self.href_slug_url(href, page_options), dict_options.get('cache', False))
+            if body is None:
+                self._module.fail_json(msg=info['msg'], status=info['status'])
+            page = body if isinstance(body, dict) else json.loads(body)
+            resources = page.get('resources') or []
+            offset += len(resources)
+            total = page.get('subquery_count', page.get('count'))
+            if total is not None:
+                # The appliance may cap the page size below limit, so only the total tells the last page
+                done = offset >= total or not resources
+            else:
+                done = len(resources) < limit
+            yield page, resources, None if done else offset
+            if done:
+                return
+
+
+    def vmdb_sections(self, dict_options):
+        """
+            The top level keys the projection option needs from a vmdb object response
+        """
+        if not dict_options.get('projection'):
+            return None
+        return sorted(set(path.split('.')[0] for path in dict_options['projection']))
+
+
+    def vmdb_value(self, body, dict_options):
+        """
+            Decode a vmdb object response and apply the projection option
+        """
+        value = body if isinstance(body, dict) else json.loads(body)
+        if dict_options.get('projection'):
+            try:
+                return project(value, dict_options['projection'])
+            except ProjectionError as error:
+                self._module.fail_json(msg=str(error))
+        return value
+
+
+    @operation(dict_spec(attribute=required(), value=required('raw')), network=True)
     def set_state_var(self, dict_options):
         """
             Set the state_var called with the passed in value
         """
 
-        new_attribute = dict_options['attribute']
-        new_value = dict_options['value']
-        self._target['workspace']['input']['state_vars'][new_attribute] = new_value
-        self._target['workspace']['output']['state_vars'][new_attribute] = new_value
+        self.update_state_var(dict_options['attribute'], dict_options['value'])
         return self.set_or_commit()
 
 
+    @operation(dict_spec(interval=dict(type='int')), network=True)
     def set_retry(self, dict_options):
         """
             Set Retry
         """
         retry_interval = dict_options.get('interval') or DEFAULT_RETRY_INTERVAL
 
-        attributes = dict()
-        attributes['object'] = 'root'
-        attributes['attributes'] = dict(ae_result='retry', ae_retry_interval=retry_interval)
+        attributes = dict(ae_result='retry', ae_retry_interval=retry_interval)
 
-        self.set_attributes(attributes)
+        self.update_object_attributes('root', attributes)
         return self.set_or_commit()
 
 
+    @operation(dict_spec(object=required(), attribute=required(), value=required(no_log=True)), network=True)
     def set_encrypted_attribute(self, dict_options):
         """
             Set encrypted attribute
@@ -367,6 +1748,7 @@ class Workspace(ManageIQAutomate):
         return dict(changed=True, value=encrypted_attribute)
 
 
+    @operation(dict_spec(object=required(), attribute=required(), value=required('raw')), network=True)
     def set_attribute(self, dict_options):
         """
             Set the attribute called on the object with the passed in value
@@ -375,16 +1757,15 @@ class Workspace(ManageIQAutomate):
         new_attribute = dict_options['attribute']
         new_value = dict_options['value']
         obj = self.get_real_object_name(dict_options)
-        if self.object_exists(dict_options):
-            self._target['workspace']['input']['objects'][obj][new_attribute] = new_value
-            new_dict = {obj:{new_attribute: new_value}}
-            self._target['workspace']['output']['objects'] = new_dict
+        if self.object_exists(dict_options)['value']:
+            self.update_object_attributes(obj, {new_attribute: new_value})
             return self.set_or_commit()
         else:
             msg = 'Failed to set the attribute %s with value %s for %s' % (new_attribute, new_value, obj)
             self._module.fail_json(msg=msg, changed=False)
 
 
+    @operation(dict_spec(object=required(), attributes=required('dict')), network=True)
     def set_attributes(self, dict_options):
         """
             Set the attributes called on the object with the passed in values
@@ -392,39 +1773,295 @@ class Workspace(ManageIQAutomate):
         new_attributes = dict_options['attributes']
 
         obj = dict_options['object']
-        if self.object_exists(dict_options):
-            for new_attribute, new_value in new_attributes.items():
-                self._target['workspace']['input']['objects'][obj][new_attribute] = new_value
-                if self._target['workspace']['output']['objects'].get(obj) is None:
-                    self._target['workspace']['output']['objects'][obj] = dict()
-                self._target['workspace']['output']['objects'][obj][new_attribute] = new_value
+        if self.object_exists(dict_options)['value']:
+            self.update_object_attributes(obj, new_attributes)
             return self.set_or_commit()
         else:
             msg = 'Failed to set the attributes %s for %s' % (new_attributes, obj)
             self._module.fail_json(msg=msg, changed=False)
 
 
+    @operation(dict_spec(objects=dict(type='dict'), state_vars=dict(type='dict')), network=True)
+    def set_objects(self, dict_options):
+        """
+            Set the attributes of several objects and state_vars in one pass, committing at most once
+        """
+        objects = dict_options.get('objects') or dict()
+        state_vars = dict_options.get('state_vars') or dict()
+
+        missing = [obj for obj in objects if not self.object_exists(obj)['value']]
+        if missing:
+            msg = 'Failed to set the attributes for %s, the objects do not exist' % ', '.join(sorted(missing))
+            self._module.fail_json(msg=msg, changed=False)
+
+        for obj, new_attributes in objects.items():
+            self.update_object_attributes(self.get_real_object_name(dict(object=obj)), new_attributes)
+        for new_attribute, new_value in state_vars.items():
+            self.update_state_var(new_attribute, new_value)
+        if not objects and not state_vars:
+            return dict(changed=False)
+        return self.set_or_commit()
+
+
+    def update_object_attributes(self, obj, new_attributes):
+        """
+            Update the attributes on the object in the input and the output without committing
+        """
+        for new_attribute, new_value in new_attributes.items():
+            self.input_set(['objects', obj, new_attribute], new_value)
+            self._view.set(['workspace', 'output', 'objects', obj, new_attribute], new_value)
+            self.track_pending_attribute(obj, new_attribute)
+
+
+    def update_state_var(self, new_attribute, new_value):
+        """
+            Update the state_var in the input and the output without committing
+        """
+        self.input_set(['state_vars', new_attribute], new_value)
+        self._view.set(['workspace', 'output', 'state_vars', new_attribute], new_value)
+        self.track_pending_state_var(new_attribute)
+
+
+    def track_pending_attribute(self, obj, attribute):
+        """
+            Record an object attribute changed since the last commit
+        """
+        pending = self._target['workspace'].get('pending')
+        if pending is None:
+            return
+        attributes = pending['objects'].get(obj, [])
+        if attribute not in attributes:
+            self._view.set(['workspace', 'pending', 'objects', obj], attributes + [attribute])
+
+
+    def track_pending_state_var(self, attribute):
+        """
+            Record a state_var changed since the last commit
+        """
+        pending = self._target['workspace'].get('pending')
+        if pending is None:
+            return
+        if attribute not in pending['state_vars']:
+            self._view.set(['workspace', 'pending', 'state_vars'], pending['state_vars'] + [attribute])
+
+
+    def pending_output(self):
+        """
+            The part of the output changed since the last commit
+
+            Workspaces initialized without pending tracking send the whole output
+        """
+        output = self._target['workspace']['output']
+        pending = self._target['workspace'].get('pending')
+        if pending is None:
+            return output
+
+        objects = dict()
+        for obj, attributes in pending['objects'].items():
+            output_obj = output['objects'].get(obj, dict())
+            changed_attributes = dict((attribute, output_obj[attribute]) for attribute in attributes if attribute in output_obj)
+            if changed_attributes:
+                objects[obj] = changed_attributes
+        state_vars = dict((attribute, output['state_vars'][attribute]) for attribute in pending['state_vars'])
+        return dict(objects=objects, state_vars=state_vars)
+
+
+    def dispatch(self, name, value):
+        """
+            Call the Workspace method registered for the operation with its parameter
+        """
+        registered = OPERATIONS[name]
+        method = getattr(self, registered['method'])
+        if registered['spec']['type'] == 'bool':
+            return method()
+        return method(value)
+
+
+    @operation(dict(type='list', elements='dict'), network=True, batch=False, name='operations')
+    def run_operations(self, operations):
+        """
+            Run an ordered list of operations against this Workspace and commit at most once
+        """
+        results = dict()
+        changed = False
+        self._batch = True
+        for index, operation in enumerate(operations):
+            operation = dict(operation)
+            name = operation.pop('name', None)
+            if len(operation) != 1:
+                self._module.fail_json(msg='Operation %s must contain exactly one operation' % index)
+            key, value = list(operation.items())[0]
+            if name is None:
+                name = key
+            if name in results:
+                self._module.fail_json(msg='Duplicate operation name %s, set a unique \'name\'' % name)
+
+            if key not in OPERATIONS or not OPERATIONS[key]['batch']:
+                self._module.fail_json(msg='Operation %s is not supported in operations' % key)
+            result = self.dispatch(key, self.operation_argument(index, key, value))
+            changed = changed or result.get('changed', False)
+            results[name] = result.get('value')
+        self._batch = False
+
+        if changed and self.auto_commit():
+            result = self.commit_workspace()
+        elif changed:
+            self.write_checkpoint(self._target['workspace'])
+            result = dict(changed=True, workspace=self._target['workspace'])
+        else:
+            result = dict(changed=False)
+        result['results'] = results
+        return result
+
+
+    def operation_argument(self, index, key, value):
+        """
+            The value of an entry of operations, checked and converted against the spec of its operation
+        """
+        try:
+            from ansible.module_utils.common.arg_spec import ArgumentSpecValidator
+        except ImportError:
+            return value
+        validated = ArgumentSpecValidator({key: dict(OPERATIONS[key]['spec'], required=True)}).validate({key: value})
+        if validated.error_messages:
+            self._module.fail_json(msg='Operation %s: %s' % (index, ', '.join(validated.error_messages)))
+        return validated.validated_parameters[key]
+
+
+    def fan_out(self, items, workers, operation):
+        """
+            Run the operation concurrently on a Workspace for each (automate_workspace, workspace) item
+
+            Returns the results and the errors keyed by automate_workspace
+        """
+        value = dict()
+        errors = dict()
+        if not items:
+            return value, errors
+
+        def run(item):
+            automate_workspace, target = item
+            workspace = Workspace(FanOutModule(self._module), target, automate_workspace)
+            workspace.profile = self.profile
+            try:
+                return automate_workspace, operation(workspace), None
+            except Exception as error:
+                # A failure of one workspace is reported with the others instead of failing the task
+                return automate_workspace, None, error_message(error)
+
+        for automate_workspace, result, error in self.map_concurrently(run, items, workers):
+            if error is None:
+                value[automate_workspace] = result
+            else:
+                errors[automate_workspace] = error
+        return value, errors
+
+
+    @operation(dict_spec(automate_workspaces=required('list', elements='str'), workers=dict(type='int'), **initialize_options()),
+               read_only=True, network=True, batch=False)
+    def initialize_workspaces(self, dict_options):
+        """
+            Initialize several automate workspaces concurrently, keyed by automate_workspace
+        """
+        def initialize(workspace):
+            result = workspace.initialize_workspace(dict_options)['workspace']
+            result['options']['automate_workspace'] = workspace._automate_workspace
+            return result
+
+        items = [(automate_workspace, None) for automate_workspace in dict_options['automate_workspaces']]
+        value, errors = self.fan_out(items, dict_options.get('workers'), initialize)
+        return dict(changed=False, value=value, errors=errors)
+
+
+    @operation(dict_spec(workspaces=required('raw'), workers=dict(type='int')), network=True, batch=False)
+    def commit_workspaces(self, dict_options):
+        """
+            Commit several workspaces from initialize_workspaces concurrently, keyed by automate_workspace
+        """
+        workspaces = dict_options['workspaces']
+        if isinstance(workspaces, dict):
+            workspaces = list(workspaces.values())
+
+        items = []
+        errors = dict()
+        for index, target in enumerate(workspaces):
+            if 'workspace' not in target:
+                target = dict(workspace=target)
+            automate_workspace = (target['workspace'].get('options') or dict()).get('automate_workspace')
+            if automate_workspace is None:
+                errors[str(index)] = 'Workspace %s was not initialized by initialize_workspaces' % index
+            else:
+                items.append((automate_workspace, target))
+
+        results, commit_errors = self.fan_out(items, dict_options.get('workers'),
+                                              lambda workspace: workspace.commit_workspace())
+        errors.update(commit_errors)
+        value = dict((automate_workspace, result['workspace']) for automate_workspace, result in results.items())
+        changed = any(result['changed'] for result in results.values())
+        return dict(changed=changed, value=value, errors=errors)
+
+
+    def with_loaded_input(self, result):
+        """
+            Return the workspace with the result when its input was fetched lazily, so it can be registered
+        """
+        if self.input_loaded and 'workspace' not in result:
+            result = dict(result, workspace=self._target['workspace'])
+        return result
+
+
+    @operation(dict(type='bool', default=False), network=True, batch=False)
     def commit_workspace(self):
         """
-            Commit the workspace and re apply the auto_commit options
+            Commit the changes made since the last commit and re apply the auto_commit options
+
+            Nothing is sent when there are no pending changes. Once committed the local checkpoint
+            is removed, as nothing is left to resume
         """
         auto_commit_dict = self._target['workspace'].get('options')
-        workspace = self.set(self._target['workspace']['output'])
+        output = self.pending_output()
+        if not output.get('objects') and not output.get('state_vars'):
+            self.remove_checkpoint(self._target['workspace'])
+            return dict(changed=False, workspace=self._target['workspace'])
+
+        workspace = self.set(output)
         if 'options' not in workspace.keys():
             workspace['options'] = auto_commit_dict
+        workspace['pending'] = dict(objects=dict(), state_vars=list())
+        self.remove_checkpoint(self._target['workspace'])
         return dict(changed=True, workspace=workspace)
 
 
+    @operation(dict_spec(**initialize_options()), read_only=True, network=True, batch=False)
     def initialize_workspace(self, dict_options):
         """
             Initialize the Workspace with auto_commit set to true or false
-        """
 
-        workspace = self.get()
-        workspace['options'] = dict(auto_commit=(dict_options.get('auto_commit') or False))
+            With resume the workspace is read from its local checkpoint when there is one,
+            and its pending changes are sent again by the next commit
+        """
+        checkpoint = None
+        if dict_options.get('checkpoint'):
+            checkpoint = dict_options.get('checkpoint_path') or DEFAULT_CHECKPOINT_PATH
+            if dict_options.get('resume'):
+                workspace = self.read_checkpoint(checkpoint)
+                if workspace is not None:
+                    workspace['options']['auto_commit'] = dict_options.get('auto_commit') or False
+                    return dict(changed=False, resumed=True, workspace=workspace)
+
+        if dict_options.get('lazy'):
+            workspace = self.get(self.url() + '?attributes=guid,current')
+            workspace.pop('input', None)
+        else:
+            workspace = self.get()
+        workspace['options'] = dict(auto_commit=(dict_options.get('auto_commit') or False),
+                                    lazy=bool(dict_options.get('lazy')),
+                                    checkpoint=checkpoint)
         workspace['output'] = dict(objects=dict(), state_vars=dict())
+        workspace['pending'] = dict(objects=dict(), state_vars=list())
+        self.write_checkpoint(workspace)
 
-        return dict(changed=False, workspace=workspace)
+        return dict(changed=False, resumed=False, workspace=workspace)
 
 
 def manageiq_argument_spec():
@@ -440,6 +2077,42 @@ def manageiq_argument_spec():
         force_basic_auth=dict(required=False, type='bool', default='no'),
         client_cert=dict(required=False, type='path', default=None),
         client_key=dict(required=False, type='path', default=None),
+        keep_alive=dict(required=False, type='bool', default=False),
+        vmdb_cache=dict(required=False, type='bool', default=False),
+        vmdb_cache_path=dict(required=False, type='path', default=None),
+        vmdb_cache_ttl=dict(required=False, type='int', default=DEFAULT_VMDB_CACHE_TTL),
+        vmdb_cache_size=dict(required=False, type='int', default=DEFAULT_VMDB_CACHE_SIZE),
+        retries=dict(required=False, type='int', default=DEFAULT_RETRIES),
+        retry_backoff=dict(required=False, type='float', default=DEFAULT_RETRY_BACKOFF),
+        retry_max_backoff=dict(required=False, type='float', default=DEFAULT_RETRY_MAX_BACKOFF),
+        retry_posts=dict(required=False, type='bool', default=False),
+        circuit_breaker_threshold=dict(required=False, type='int', default=DEFAULT_CIRCUIT_BREAKER_THRESHOLD),
+        circuit_breaker_timeout=dict(required=False, type='int', default=DEFAULT_CIRCUIT_BREAKER_TIMEOUT),
+        max_response_size=dict(required=False, type='int', default=None),
+        rate_limit=dict(required=False, type='float', default=None),
+        rate_burst=dict(required=False, type='int', default=None),
+        max_concurrency=dict(required=False, type='int', default=None),
+        cache_token=dict(required=False, type='bool', default=False),
+        token_cache_path=dict(required=False, type='path', default=None),
+        state_path=dict(required=False, type='path', default=None),
+    )
+
+
+def module_argument_spec():
+    """
+        The argument spec of the module, also used by the action plugin to validate the operations it answers
+    """
+    return dict(
+        manageiq_connection=dict(required=True, type='dict',
+                                 options=manageiq_argument_spec()),
+        commit_attribute=dict(required=False, type='dict'),
+        commit_attributes=dict(required=False, type='dict'),
+        commit_state_var=dict(required=False, type='dict'),
+        workspace=dict(required=False, type='dict'),
+        workspace_delta=dict(required=False, type='bool', default=False),
+        workspace_base_hash=dict(required=False, type='str'),
+        profile=dict(required=False, type='bool', default=False),
+        **operation_argument_spec()
     )
 
 
@@ -447,75 +2120,46 @@ def main():
     """
         The entry point to the ManageIQ Automate module
     """
-    module = AnsibleModule(
-            argument_spec=dict(
-                manageiq_connection=dict(required=True, type='dict',
-                                         options=manageiq_argument_spec()),
-                initialize_workspace=dict(required=False, type='dict'),
-                commit_workspace=dict(type='bool', default=False),
-                set_attribute=dict(required=False, type='dict'),
-                set_attributes=dict(required=False, type='dict'),
-                object_exists=dict(required=False, type='str'),
-                attribute_exists=dict(required=False, type='dict'),
-                state_var_exists=dict(required=False, type='dict'),
-                method_parameter_exists=dict(required=False, type='dict'),
-                commit_attribute=dict(required=False, type='dict'),
-                commit_attributes=dict(required=False, type='dict'),
-                commit_state_var=dict(required=False, type='dict'),
-                get_attribute=dict(required=False, type='dict'),
-                get_state_var=dict(required=False, type='dict'),
-                get_method_parameter=dict(required=False, type='dict'),
-                set_retry=dict(required=False, type='dict'),
-                set_state_var=dict(required=False, type='dict'),
-                set_encrypted_attribute=dict(required=False, type='dict'),
-                get_vmdb_object=dict(required=False, type='dict'),
-                get_decrypted_attribute=dict(required=False, type='dict'),
-                get_decrypted_method_parameter=dict(required=False, type='dict'),
-                get_object_names=dict(required=False, type='bool'),
-                get_state_var_names=dict(required=False, type='bool'),
-                get_method_parameters=dict(required=False, type='bool'),
-                get_object_attribute_names=dict(required=False, type='dict'),
-                workspace=dict(required=False, type='dict')
-                ),
-            )
-
-    argument_opts = {
-        'initialize_workspace':module.params['initialize_workspace'],
-        'commit_workspace':module.params['commit_workspace'],
-        'get_attribute':module.params['get_attribute'],
-        'get_method_parameter':module.params['get_method_parameter'],
-        'get_state_var':module.params['get_state_var'],
-        'get_object_attribute_names':module.params['get_object_attribute_names'],
-        'get_vmdb_object':module.params['get_vmdb_object'],
-        'get_decrypted_attribute':module.params['get_decrypted_attribute'],
-        'get_decrypted_method_parameter':module.params['get_decrypted_method_parameter'],
-        'object_exists':module.params['object_exists'],
-        'method_parameter_exists':module.params['method_parameter_exists'],
-        'attribute_exists':module.params['attribute_exists'],
-        'state_var_exists':module.params['state_var_exists'],
-        'set_attribute':module.params['set_attribute'],
-        'set_attributes':module.params['set_attributes'],
-        'set_encrypted_attribute':module.params['set_encrypted_attribute'],
-        'set_retry':module.params['set_retry'],
-        'set_state_var':module.params['set_state_var']
-        }
-
-    boolean_opts = {
-        'get_object_names':module.params['get_object_names'],
-        'get_method_parameters':module.params['get_method_parameters'],
-        'get_state_var_names':module.params['get_state_var_names']
-        }
-
+    main_started = time.time()
+    module = AnsibleModule(argument_spec=module_argument_spec())
+
+    requested = requested_operations(module.params)
+    if len(requested) > 1:
+        module.fail_json(msg='Only one operation can be given per task, got %s. Use operations to run several' % ', '.join(requested))
+
+    base = base_hash = None
+    if module.params['workspace_delta'] and module.params['workspace']:
+        # The Workspace only changes copies, so the passed in workspace stays the base of the delta
+        base = module.params['workspace'].get('workspace')
+        base_hash = workspace_hash(base)
+        if module.params['workspace_base_hash'] not in (None, base_hash):
+            module.warn('The passed in workspace does not match the one the caller holds, returning the full workspace')
+            base = base_hash = None
+    profile = None
+    if module.params['profile']:
+        profile = Profile()
+        profile.phases['startup'] = round(main_started - IMPORT_STARTED, 6)
+        module = ProfiledModule(module, profile)
     workspace = Workspace(module, module.params['workspace'])
-
-    for key, value in boolean_opts.items():
-        if value:
-            result = getattr(workspace, key)()
-            module.exit_json(**result)
-    for key, value in argument_opts.items():
-        if value:
-            result = getattr(workspace, key)(value)
-            module.exit_json(**result)
+    if profile is not None:
+        workspace.profile = profile
+        profile.phase('arguments', main_started)
+
+    def exit_with(result):
+        delta_started = time.time()
+        if workspace.profile is not None:
+            workspace.profile.phase('operation', operation_started)
+        result = delta_result(result, base, base_hash)
+        if workspace.profile is not None:
+            workspace.profile.phase('delta', delta_started)
+            result['profile'] = workspace.profile.result()
+        module.exit_json(**result)
+
+    operation_started = time.time()
+    if profile is not None:
+        module.operation_started = operation_started
+    for key in requested:
+        exit_with(workspace.with_loaded_input(workspace.dispatch(key, module.params[key])))
 
 
     module.fail_json(msg="No workspace found")
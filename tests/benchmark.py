@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+#
+# Benchmark the manageiq_automate Workspace operations against a local
+# stand in for the ManageIQ automate_workspaces API.
+#
+#   python tests/benchmark.py --latency 20 --objects 200 --iterations 50
+#
+# Reports calls per second, round trips and payload bytes for each operation,
+# then the startup cost of a fresh interpreter running a read only task, which
+# fails the run when it is over --startup-budget milliseconds.
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ansible.module_utils.six.moves import BaseHTTPServer, socketserver
+
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'library')
+sys.path.insert(0, LIBRARY_PATH)
+import manageiq_automate  # noqa: E402
+
+WORKSPACE_PATH = 'automate_workspaces/1234'
+
+# Modules a read only task should never need to import
+NETWORK_MODULES = ('ansible.module_utils.urls', 'http.client', 'httplib', 'ssl', 'multiprocessing.pool')
+
+IMPORT_SCRIPT = '''
+import json, sys, time
+started = time.time()
+sys.path.insert(0, %r)
+import manageiq_automate
+print(json.dumps(dict(elapsed=time.time() - started, loaded=[name for name in %r if name in sys.modules])))
+'''
+
+
+class Stats(object):
+    """
+        Round trips and payload bytes seen by the API stand in
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+    def record(self, sent, received):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+
+class ApiHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+        Answers the automate_workspaces and vmdb object requests the module makes
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+    def _respond(self, data, received):
+        time.sleep(self.server.latency)
+        body = json.dumps(data).encode('utf-8')
+        self.server.stats.record(received, len(body))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def do_GET(self):
+        if self.path.startswith('/api/' + WORKSPACE_PATH):
+            self._respond(self.server.workspace, 0)
+        elif re.match(r'/api/\w+/\d+', self.path):
+            self._respond(self.server.vmdb_object, 0)
+        else:
+            self.send_error(404)
+
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        data = json.loads(self.rfile.read(length))
+        if data['action'] == 'edit':
+            self._respond(dict(self.server.workspace, output=data['resource']), length)
+        elif 'resources' in data:
+            self._respond(dict(results=[dict(value='v2:{secret}') for _resource in data['resources']]), length)
+        else:
+            self._respond(dict(value='v2:{secret}'), length)
+
+
+class ApiServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency, objects, attributes, payload_bytes):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), ApiHandler)
+        self.latency = latency
+        self.stats = Stats()
+        filler = 'x' * payload_bytes
+        workspace_objects = dict()
+        for index in range(objects):
+            workspace_objects['object_%d' % index] = dict(('attribute_%d' % attribute, filler) for attribute in range(attributes))
+        workspace_objects['root'] = dict(vm='vms::vms/1', secret='v2:{secret}')
+        self.workspace = dict(guid='1234',
+                              current=dict(namespace='ManageIQ', instance='bench'),
+                              input=dict(objects=workspace_objects,
+                                         state_vars=dict(('state_var_%d' % index, filler) for index in range(attributes)),
+                                         method_parameters=dict(parameter=filler)))
+        self.vmdb_object = dict(id='1', name='vm', description=filler, hardware=dict(cpu_total_cores=2))
+
+
+class BenchModule(object):
+    """
+        Stand in for AnsibleModule holding the params the Workspace reads
+    """
+
+    def __init__(self, url, keep_alive):
+        connection = dict((k, v.get('default')) for k, v in manageiq_automate.manageiq_argument_spec().items())
+        connection.update(url=url, username='admin', password='smartvm', automate_workspace=WORKSPACE_PATH,
+                          keep_alive=keep_alive)
+        # fetch_url reads these from the module, the Workspace fills in the url_* and validate_certs params,
+        # no tmpdir keeps tempfile on its default directory as the benchmark downloads nothing
+        self.params = dict(manageiq_connection=connection, http_agent=None, use_proxy=True)
+        self.tmpdir = None
+
+
+    def fail_json(self, **kwargs):
+        raise RuntimeError(kwargs['msg'])
+
+
+def run(name, server, iterations, module, workspace, operation):
+    server.stats.reset()
+    start = time.time()
+    for _iteration in range(iterations):
+        operation(manageiq_automate.Workspace(module, workspace))
+    elapsed = time.time() - start
+    stats = server.stats
+    print('%-32s %8d %10.1f %8d %12d %12d' % (name, iterations, iterations / elapsed, stats.requests,
+                                              stats.bytes_sent, stats.bytes_received))
+
+
+def startup(name, iterations, command, budget=None):
+    """
+        Run the command in a fresh interpreter iterations times and report the median wall time
+    """
+    timings = []
+    output = None
+    for _iteration in range(iterations):
+        start = time.time()
+        output = subprocess.check_output(command)
+        timings.append(time.time() - start)
+    median = sorted(timings)[len(timings) // 2] * 1000
+    verdict = ''
+    if budget is not None:
+        verdict = 'ok' if median <= budget else 'OVER BUDGET (%dms)' % budget
+    print('%-32s %8d %10.1f ms %s' % (name, iterations, median, verdict))
+    return median, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark manageiq_automate Workspace operations')
+    parser.add_argument('--latency', type=float, default=5, help='API latency in milliseconds')
+    parser.add_argument('--objects', type=int, default=50, help='objects in the workspace input')
+    parser.add_argument('--attributes', type=int, default=20, help='attributes per object')
+    parser.add_argument('--payload-bytes', type=int, default=64, help='size of each attribute value')
+    parser.add_argument('--iterations', type=int, default=20, help='calls per operation')
+    parser.add_argument('--keep-alive', action='store_true', help='reuse connections instead of using fetch_url')
+    parser.add_argument('--startup-budget', type=float, default=300, help='budget for a read only task in milliseconds')
+    args = parser.parse_args()
+
+    server = ApiServer(args.latency / 1000.0, args.objects, args.attributes, args.payload_bytes)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    module = BenchModule('http://127.0.0.1:%d' % server.server_address[1], args.keep_alive)
+
+    initialized = manageiq_automate.Workspace(module, None).initialize_workspace(dict(auto_commit=False))
+    attribute = dict(object='object_0', attribute='attribute_0')
+    attributes = dict(object='root', attributes=dict(('attribute_%d' % index, index) for index in range(args.attributes)))
+
+    def workspace(auto_commit):
+        # Each call gets its own copy, as each task gets its own module arguments
+        target = json.loads(json.dumps(initialized))
+        target['workspace']['options']['auto_commit'] = auto_commit
+        return target
+
+    print('%-32s %8s %10s %8s %12s %12s' % ('operation', 'calls', 'calls/s', 'requests', 'bytes sent', 'bytes recv'))
+    run('initialize_workspace', server, args.iterations, module, None,
+        lambda w: w.initialize_workspace(dict(auto_commit=True)))
+    run('attribute_exists + get_attribute', server, args.iterations, module, workspace(False),
+        lambda w: (w.attribute_exists(attribute), w.get_attribute(attribute)))
+    run('set_attributes auto_commit off', server, args.iterations, module, workspace(False),
+        lambda w: w.set_attributes(attributes))
+    run('set_attributes auto_commit on', server, args.iterations, module, workspace(True),
+        lambda w: w.set_attributes(attributes))
+    run('get_vmdb_object', server, args.iterations, module, workspace(False),
+        lambda w: w.get_vmdb_object(dict(object='root', attribute='vm', cache=False)))
+    run('get_vmdb_objects (10)', server, args.iterations, module, workspace(False),
+        lambda w: w.get_vmdb_objects(dict(objects=['vms/%d' % index for index in range(10)], cache=False)))
+    run('get_decrypted_attribute', server, args.iterations, module, workspace(False),
+        lambda w: w.get_decrypted_attribute(dict(object='root', attribute='secret')))
+    run('set_encrypted_attribute', server, args.iterations, module, workspace(False),
+        lambda w: w.set_encrypted_attribute(dict(object='root', attribute='secret', value='smartvm')))
+    run('decrypt_attributes (10)', server, args.iterations, module, workspace(False),
+        lambda w: w.decrypt_attributes(dict(attributes=[dict(object='root', attribute='secret_%d' % index) for index in range(10)])))
+    server.shutdown()
+
+    print()
+    print('%-32s %8s %13s' % ('startup', 'runs', 'median'))
+    _elapsed, output = startup('import', args.iterations,
+                               [sys.executable, '-c', IMPORT_SCRIPT % (LIBRARY_PATH, NETWORK_MODULES)])
+    loaded = json.loads(output)['loaded']
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as args_file:
+        json.dump(dict(ANSIBLE_MODULE_ARGS=dict(workspace=workspace(False), manageiq_connection=module.params['manageiq_connection'],
+                                                get_attribute=attribute)), args_file)
+        args_file.flush()
+        elapsed, _output = startup('get_attribute task', args.iterations,
+                                   [sys.executable, os.path.join(LIBRARY_PATH, 'manageiq_automate.py'), args_file.name],
+                                   args.startup_budget)
+    if loaded:
+        print('network modules loaded on import: %s' % ', '.join(loaded))
+    if loaded or elapsed > args.startup_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+#
+# Check how the manageiq_automate Workspace handles failing API requests
+# against a local stand in for the ManageIQ REST API.
+#
+#   python tests/check_api.py
+#
+# Each check answers the module's requests its own way and reports a failure
+# message, the run fails when any check does.
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from ansible.module_utils.six.moves import BaseHTTPServer, socketserver
+
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'library')
+sys.path.insert(0, LIBRARY_PATH)
+import manageiq_automate  # noqa: E402
+
+WORKSPACE_PATH = 'automate_workspaces/1234'
+
+
+class ApiHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+        Answers each request with the status, body and optional headers the check set for its path
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+
+    def _answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.server.requests.append((self.command, self.path, self.rfile.read(length) if length else None, dict(self.headers)))
+        response = self.server.respond(self.command, self.path)
+        if response is None:
+            # Drop the connection without answering
+            self.close_connection = True
+            return
+        status, body = response[:2]
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (response[2] if len(response) > 2 else dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _answer
+
+
+class ApiServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), ApiHandler)
+        self.requests = []
+        self.respond = lambda method, path: (404, dict(error='not found'))
+
+
+class CheckModule(object):
+    """
+        Stand in for AnsibleModule that exits on fail_json the way it does
+    """
+
+    def __init__(self, url, state_path, **connection_options):
+        connection = dict((k, v.get('default')) for k, v in manageiq_automate.manageiq_argument_spec().items())
+        connection.update(url=url, username='admin', password='smartvm', automate_workspace=WORKSPACE_PATH,
+                          state_path=state_path, retries=0, circuit_breaker_threshold=0)
+        connection.update(connection_options)
+        self.params = dict(manageiq_connection=connection, http_agent=None, use_proxy=False)
+        self.tmpdir = None
+        self.failure = None
+
+
+    def fail_json(self, **kwargs):
+        self.failure = kwargs
+        raise SystemExit(kwargs.get('msg'))
+
+
+def workspace(objects=None):
+    return dict(workspace=dict(guid='1234', options=dict(auto_commit=False),
+                               input=dict(objects=objects or dict(root=dict(name='root')),
+                                          state_vars=dict(), method_parameters=dict(), current=dict())))
+
+
+def check_vmdb_objects_failures(server, module):
+    """
+        One failing href is reported in errors while the others come back in value
+    """
+    def respond(method, path):
+        if path.startswith('/api/vms/2'):
+            return 200, b'not json'
+        if path.startswith('/api/vms/3'):
+            return 500, dict(error='failed')
+        if path.startswith('/api/vms/4'):
+            return None
+        return 200, dict(id=path.split('/')[3].split('?')[0], name='vm')
+    server.respond = respond
+
+    result = manageiq_automate.Workspace(module, workspace()).get_vmdb_objects(
+        dict(objects=['vms/%d' % index for index in range(1, 6)], cache=False))
+    if sorted(result['value']) != ['vms/1', 'vms/5'] or result['value']['vms/5']['id'] != '5':
+        return 'get_vmdb_objects values %s' % result['value']
+    if sorted(result['errors']) != ['vms/2', 'vms/3', 'vms/4']:
+        return 'get_vmdb_objects errors %s' % result['errors']
+    return None
+
+
+def check_vmdb_projection(server, module):
+    """
+        Zero padded list indexes pick the same item, a bad index is reported for its object
+    """
+    def respond(method, path):
+        if path.startswith('/api/vms/1'):
+            return 200, dict(id='1', disks=[dict(size=10, name='a'), dict(size=20, name='b')])
+        return 200, dict(id='2', disks=[dict(size=30, name='c')])
+    server.respond = respond
+
+    result = manageiq_automate.Workspace(module, workspace()).get_vmdb_objects(
+        dict(objects=['vms/1', 'vms/2'], projection=['disks.01.size', 'disks.1.name'], cache=False))
+    if result['value'] != {'vms/1': dict(disks=[dict(size=20, name='b')])}:
+        return 'get_vmdb_objects values %s' % result['value']
+    if 'out of range' not in result['errors'].get('vms/2', ''):
+        return 'get_vmdb_objects errors %s' % result['errors']
+    return None
+
+
+def collection_responder(size, page_size, count=True):
+    """
+        Answer a vms collection of size resources, at most page_size of them per page
+    """
+    def respond(method, path):
+        query = dict(part.split('=') for part in path.split('?')[1].split('&'))
+        offset = int(query.get('offset', 0))
+        end = min(offset + int(query['limit']), offset + page_size, size)
+        page = dict(resources=[dict(id=str(index)) for index in range(offset, end)])
+        if count:
+            page['count'] = size
+        return 200, page
+    return respond
+
+
+def check_vmdb_collection_pages(server, module):
+    """
+        Pages capped below limit by the appliance do not end the collection early, max_pages bounds it
+    """
+    server.respond = collection_responder(7, 3)
+    result = manageiq_automate.Workspace(module, workspace()).get_vmdb_collection(dict(href='vms', limit=5))
+    if len(result['value']) != 7 or result['pages'] != 3 or result['next_offset'] is not None:
+        return 'capped pages returned %d resources in %d pages' % (len(result['value']), result['pages'])
+
+    server.respond = collection_responder(7, 3, count=False)
+    result = manageiq_automate.Workspace(module, workspace()).get_vmdb_collection(dict(href='vms', limit=3))
+    if len(result['value']) != 7 or result['next_offset'] is not None:
+        return 'pages without a count returned %d resources' % len(result['value'])
+
+    server.respond = collection_responder(1000, 10)
+    result = manageiq_automate.Workspace(module, workspace()).get_vmdb_collection(dict(href='vms', limit=10))
+    if result['pages'] != manageiq_automate.DEFAULT_MAX_PAGES or result['next_offset'] != 10 * result['pages']:
+        return 'a large collection read %d pages up to %s' % (result['pages'], result['next_offset'])
+    return None
+
+
+def check_vmdb_cache_ttl_zero(server, module):
+    """
+        vmdb_cache_ttl 0 revalidates the cached object on every use
+    """
+    def respond(method, path):
+        if 'If-None-Match' in server.requests[-1][3]:
+            return 304, b''
+        return 200, dict(id='1', name='vm'), {'ETag': '"1"'}
+    server.respond = respond
+    module.params['manageiq_connection'].update(vmdb_cache=True, vmdb_cache_ttl=0,
+                                                vmdb_cache_path=module.params['manageiq_connection']['state_path'])
+
+    for _use in range(3):
+        result = manageiq_automate.Workspace(module, workspace()).get_vmdb_objects(dict(objects=['vms/1']))
+        if result['value'].get('vms/1', dict()).get('name') != 'vm':
+            return 'cached get_vmdb_objects returned %s' % result
+    revalidated = [request for request in server.requests if 'If-None-Match' in request[3]]
+    if len(server.requests) != 3 or len(revalidated) != 2:
+        return '%d requests, %d revalidated' % (len(server.requests), len(revalidated))
+    return None
+
+
+def check_post_retries(server, module):
+    """
+        A failed commit is not sent twice unless retry_posts is set, a refused one is retried
+    """
+    statuses = []
+    server.respond = lambda method, path: (statuses.pop(0) if statuses else 200, dict(workspace()['workspace']))
+    module.params['manageiq_connection'].update(retries=2, retry_backoff=0, retry_max_backoff=0)
+
+    def commit():
+        server.requests = []
+        target = manageiq_automate.Workspace(module, workspace())
+        target.set_attributes(dict(object='root', attributes=dict(name='changed')))
+        return target.send('post', target.url(), json.dumps(dict(action='edit', resource=target.pending_output())))
+
+    statuses[:] = [502]
+    body, info = commit()
+    if info['status'] != 502 or len(server.requests) != 1:
+        return 'a failed POST was sent %d times' % len(server.requests)
+    statuses[:] = [429]
+    body, info = commit()
+    if body is None or len(server.requests) != 2:
+        return 'a refused POST was sent %d times' % len(server.requests)
+    module.params['manageiq_connection']['retry_posts'] = True
+    statuses[:] = [502]
+    body, info = commit()
+    if body is None or len(server.requests) != 2:
+        return 'with retry_posts a failed POST was sent %d times' % len(server.requests)
+    return None
+
+
+def check_vmdb_object_missing_attribute(server, module):
+    """
+        get_vmdb_object reports a missing or empty attribute without sending a request
+    """
+    target = workspace(dict(root=dict(vm='vms::vms/1', empty=None)))
+    for attribute in ('missing', 'empty'):
+        try:
+            manageiq_automate.Workspace(module, target).get_vmdb_object(dict(object='root', attribute=attribute))
+            return 'get_vmdb_object of %s did not fail' % attribute
+        except SystemExit as error:
+            if str(error) != 'Attribute %s does not exist for Object root' % attribute:
+                return 'get_vmdb_object of %s failed with %s' % (attribute, error)
+    if server.requests:
+        return 'get_vmdb_object sent %d requests' % len(server.requests)
+    return None
+
+
+def check_fan_out_token(server, module):
+    """
+        The workspaces of a fan out share one token from /api/auth
+    """
+    def respond(method, path):
+        if path.startswith('/api/auth'):
+            time.sleep(0.1)
+            return 200, dict(auth_token='token', token_ttl=600)
+        return 200, dict(workspace()['workspace'])
+    server.respond = respond
+    connection = module.params['manageiq_connection']
+    connection.update(cache_token=True, token_cache_path=connection['state_path'])
+
+    automate_workspaces = ['automate_workspaces/%d' % index for index in range(8)]
+    result = manageiq_automate.Workspace(module, None).initialize_workspaces(dict(automate_workspaces=automate_workspaces, workers=8))
+    if sorted(result['value']) != automate_workspaces:
+        return 'initialize_workspaces errors %s' % result['errors']
+    auth = [request for request in server.requests if request[1].startswith('/api/auth')]
+    if len(auth) != 1:
+        return '%d requests to /api/auth' % len(auth)
+    return None
+
+
+def check_failure_profile(server, module):
+    """
+        A failed operation reports the profile of its retried requests
+    """
+    server.respond = lambda method, path: (503, dict(error='unavailable'))
+    module.params['manageiq_connection'].update(retries=2, retry_backoff=0, retry_max_backoff=0)
+    profile = manageiq_automate.Profile()
+    profiled = manageiq_automate.ProfiledModule(module, profile)
+    profiled.operation_started = time.time()
+    target = manageiq_automate.Workspace(profiled, workspace())
+    target.profile = profile
+    try:
+        target.get_vmdb_collection(dict(href='vms'))
+        return 'get_vmdb_collection did not fail'
+    except SystemExit:
+        pass
+    reported = (module.failure or dict()).get('profile')
+    if not reported or 'operation' not in reported['phases']:
+        return 'the failure reported the profile %s' % reported
+    if reported['http']['requests'] != 3 or reported['http']['status_codes'] != {'503': 3}:
+        return 'the failure profiled the requests %s' % reported['http']
+    return None
+
+
+def check_commit_checkpoint(server, module):
+    """
+        A checkpoint is kept while changes are pending and removed once they are committed
+    """
+    server.respond = lambda method, path: (200, dict(workspace()['workspace']))
+    checkpoint_path = module.params['manageiq_connection']['state_path']
+    target = manageiq_automate.Workspace(module, None)
+    result = target.initialize_workspace(dict(checkpoint=True, checkpoint_path=checkpoint_path))
+    target = manageiq_automate.Workspace(module, result)
+    target.set_attributes(dict(object='root', attributes=dict(name='changed')))
+    if not os.path.exists(target.checkpoint_file(checkpoint_path)):
+        return 'no checkpoint with pending changes'
+    target.commit_workspace()
+    if os.listdir(checkpoint_path):
+        return 'checkpoints left after the commit %s' % os.listdir(checkpoint_path)
+    return None
+
+
+CHECKS = [check_vmdb_objects_failures, check_vmdb_projection, check_vmdb_collection_pages, check_vmdb_cache_ttl_zero,
+          check_post_retries, check_vmdb_object_missing_attribute, check_fan_out_token,
+          check_failure_profile, check_commit_checkpoint]
+
+
+def main():
+    server = ApiServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+    failures = []
+    for check in CHECKS:
+        state_path = tempfile.mkdtemp()
+        try:
+            server.requests = []
+            failure = check(server, CheckModule(url, state_path))
+        except (Exception, SystemExit) as error:
+            failure = 'raised %s: %s' % (type(error).__name__, error)
+        finally:
+            shutil.rmtree(state_path)
+        print('%-40s %s' % (check.__name__, failure or 'ok'))
+        if failure:
+            failures.append(check.__name__)
+    server.shutdown()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
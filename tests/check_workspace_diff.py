@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# Check the workspace delta the module returns to the action plugin.
+#
+#   python tests/check_workspace_diff.py --rounds 200 --seed 1
+#
+# Changes random workspaces, through a WorkspaceView and through the Workspace
+# operations that do not need the API, and checks that applying workspace_diff
+# to the base rebuilds the changed workspace and that the base is never mutated.
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'library')
+sys.path.insert(0, LIBRARY_PATH)
+import manageiq_automate  # noqa: E402
+
+
+class CheckModule(object):
+    """
+        Stand in for AnsibleModule, with a url nothing listens on as no check should reach the API
+    """
+
+    def __init__(self):
+        connection = dict((k, v.get('default')) for k, v in manageiq_automate.manageiq_argument_spec().items())
+        connection.update(url='http://127.0.0.1:9', username='admin', password='smartvm',
+                          automate_workspace='automate_workspaces/1234')
+        self.params = dict(manageiq_connection=connection, http_agent=None, use_proxy=True)
+
+
+    def fail_json(self, **kwargs):
+        raise RuntimeError(kwargs['msg'])
+
+
+def random_value(rng, depth):
+    kind = rng.randint(0, 5 if depth < 3 else 2)
+    if kind == 0:
+        return rng.randint(0, 1000)
+    if kind == 1:
+        return 'value_%d' % rng.randint(0, 1000)
+    if kind == 2:
+        return rng.choice([None, True, False])
+    if kind == 3:
+        return [random_value(rng, depth + 1) for _index in range(rng.randint(0, 3))]
+    return dict(('key_%d' % index, random_value(rng, depth + 1)) for index in range(rng.randint(0, 4)))
+
+
+def random_workspace(rng):
+    objects = dict(('object_%d' % index, dict(('attribute_%d' % attribute, random_value(rng, 2))
+                                              for attribute in range(rng.randint(1, 5))))
+                   for index in range(rng.randint(1, 5)))
+    objects['root'] = dict(name='root')
+    return dict(guid='1234',
+                options=dict(auto_commit=False),
+                input=dict(objects=objects,
+                           method_parameters=dict(('parameter_%d' % index, random_value(rng, 2))
+                                                  for index in range(rng.randint(0, 3))),
+                           state_vars=dict(('var_%d' % index, random_value(rng, 2)) for index in range(rng.randint(0, 3))),
+                           current=dict(method='check')))
+
+
+def random_path(rng, node):
+    """
+        A path to an existing dict in the workspace and a key in it, which may be new
+    """
+    path = []
+    while True:
+        keys = list(node.keys())
+        children = [key for key in keys if isinstance(node[key], dict)]
+        if not children or rng.random() < 0.3:
+            key = rng.choice(keys) if keys and rng.random() < 0.6 else 'new_%d' % rng.randint(0, 1000)
+            return path, key
+        key = rng.choice(children)
+        path.append(key)
+        node = node[key]
+
+
+def change_view(rng, base):
+    """
+        Set and remove random paths through a WorkspaceView
+    """
+    view = manageiq_automate.WorkspaceView(base)
+    for _change in range(rng.randint(1, 6)):
+        path, key = random_path(rng, view.root)
+        container = view.container(path)
+        if key in container and rng.random() < 0.3:
+            del container[key]
+        else:
+            container[key] = random_value(rng, len(path))
+    return view.root
+
+
+def change_workspace(rng, base):
+    """
+        Change the workspace through the operations that keep to the passed in workspace
+    """
+    workspace = manageiq_automate.Workspace(CheckModule(), dict(workspace=base))
+    names = list(base['input']['objects'].keys())
+    for _change in range(rng.randint(1, 4)):
+        name = rng.choice(names)
+        choice = rng.randint(0, 2)
+        if choice == 0:
+            result = workspace.set_attributes(dict(object=name, attributes=dict(
+                ('attribute_%d' % index, random_value(rng, 2)) for index in range(rng.randint(1, 3)))))
+        elif choice == 1:
+            result = workspace.set_attribute(dict(object=name, attribute='attribute_%d' % rng.randint(0, 6),
+                                                  value=random_value(rng, 2)))
+        else:
+            result = workspace.set_state_var(dict(attribute='var_%d' % rng.randint(0, 4), value=random_value(rng, 2)))
+    return result['workspace']
+
+
+def check(name, base, change):
+    before = copy.deepcopy(base)
+    changed = change(base)
+    if base != before:
+        return '%s changed the base workspace' % name
+
+    # The delta crosses the module boundary as JSON, as it does from the module to the action plugin
+    delta = json.loads(json.dumps(manageiq_automate.delta_result(dict(workspace=changed), base)['workspace_delta']))
+    if delta['base'] != manageiq_automate.workspace_hash(before):
+        return '%s delta is not for the base workspace' % name
+    rebuilt = manageiq_automate.apply_workspace_diff(base, delta['changes'])
+    if base != before:
+        return '%s apply_workspace_diff changed the base workspace' % name
+    if rebuilt != changed:
+        return '%s round trip does not rebuild the changed workspace' % name
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the manageiq_automate workspace delta')
+    parser.add_argument('--rounds', type=int, default=200, help='random workspaces to check')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random workspaces')
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randint(0, 2 ** 32)
+    rng = random.Random(seed)
+    failures = []
+    for round_number in range(args.rounds):
+        base = random_workspace(rng)
+        for name, change in (('WorkspaceView', change_view), ('Workspace', change_workspace)):
+            failure = check(name, copy.deepcopy(base), lambda workspace: change(rng, workspace))
+            if failure:
+                failures.append('round %d: %s' % (round_number, failure))
+
+    print('%d rounds, seed %d, %d failures' % (args.rounds, seed, len(failures)))
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()